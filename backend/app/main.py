@@ -11,15 +11,29 @@ Responsibilities:
   • Trigger model loading on startup
 """
 
+import os
+
+# ─── Thread caps (must precede numpy / sklearn / torch imports) ───────────
+# One BLAS/OpenMP thread per worker: scale out with uvicorn workers instead
+# of letting every worker spawn os.cpu_count() threads and thrash.
+# Override any of these from the environment.
+for _var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "NUMEXPR_NUM_THREADS"):
+    os.environ.setdefault(_var, "1")
+
 import logging
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+import orjson
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import ORJSONResponse, Response
+from starlette.routing import Route
 
-from app.model_loader import load_model, load_xray_model, is_model_loaded
+from app.middleware import FastCORSMiddleware
+from app.model_loader import (
+    XRAY_PRELOAD, ensure_xray_model, is_model_loaded, load_model_async, stop_xray_batcher,
+)
 from app.schemas import HealthResponse
+from app.utils import get_clinical_data_json, normalise_label
 from app.routes import manual, report, xray, mri
 
 # ─── Logging configuration ────────────────────────────────────────────────
@@ -31,14 +45,47 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+# ─── OpenAPI schema cache ─────────────────────────────────────────────────
+def _cache_openapi(app: FastAPI) -> None:
+    """
+    Build the OpenAPI schema once and serve /openapi.json as pre-serialised
+    bytes.  The route replaces FastAPI's default handler in place (which
+    would otherwise re-encode the schema dict on every hit), so repeated
+    lifespan starts of the same app never register the path twice.
+    """
+    if not app.openapi_url:
+        return
+    body = orjson.dumps(app.openapi())
+
+    async def openapi_json(request) -> Response:
+        return Response(content=body, media_type="application/json")
+
+    route = Route(app.openapi_url, openapi_json, include_in_schema=False)
+    routes = app.router.routes
+    for i, existing in enumerate(routes):
+        if getattr(existing, "path", None) == app.openapi_url:
+            routes[i] = route
+            return
+    routes.insert(0, route)
+
+
 # ─── Lifespan: startup / shutdown ─────────────────────────────────────────
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """Load the ML model exactly once when the server starts."""
+    """
+    Load the tabular artifacts (in parallel) exactly once when the server
+    starts.  The X-ray CNN is loaded lazily on the first image request,
+    or here at startup when XRAY_PRELOAD=1.
+    """
     logger.info("🚀  Osteocare.ai backend starting up…")
-    load_model()
-    load_xray_model()
+    # Per-request access lines are formatted on every call; errors still log.
+    logging.getLogger("uvicorn.access").disabled = True
+    await load_model_async()
+    if XRAY_PRELOAD:
+        await ensure_xray_model()
+    _cache_openapi(app)
     yield
+    await stop_xray_batcher()
     logger.info("🛑  Osteocare.ai backend shutting down.")
 
 
@@ -53,6 +100,7 @@ app = FastAPI(
         "| `/predict/manual` | POST | Clinical-feature based prediction |\n"
         "| `/predict/report` | POST | DEXA / medical report file upload |\n"
         "| `/predict/xray`   | POST | Bone X-ray image upload |\n"
+        "| `/clinical/{label}` | GET | Clinical guidance for a class |\n"
         "| `/health`         | GET  | Service health check |\n"
     ),
     version="1.0.0",
@@ -64,19 +112,15 @@ app = FastAPI(
         "name": "MIT",
     },
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
 
 # ─── CORS ─────────────────────────────────────────────────────────────────
-# 👉 In production: replace "*" with your exact frontend origin
-#    e.g. ["https://Osteocare.ai.vercel.app", "https://your-domain.com"]
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["GET", "POST", "OPTIONS"],
-    allow_headers=["*"],
-)
+# Pure-ASGI allow-all policy with precomputed headers (see middleware/fast_cors.py).
+# 👉 In production: restrict to your exact frontend origin
+#    e.g. "https://Osteocare.ai.vercel.app"
+app.add_middleware(FastCORSMiddleware)
 
 
 # ─── Routers ──────────────────────────────────────────────────────────────
@@ -86,25 +130,43 @@ app.include_router(xray.router)
 app.include_router(mri.router)
 
 # ─── Health check ─────────────────────────────────────────────────────────
+# Probes can hit this several times a second, so the payload is returned as a
+# plain dict straight to orjson; HealthResponse only documents the shape.
 @app.get(
     "/health",
-    response_model=HealthResponse,
+    responses={200: {"model": HealthResponse}},
     tags=["Health"],
     summary="Backend + model health check",
 )
-async def health_check() -> HealthResponse:
+async def health_check() -> ORJSONResponse:
     """Returns server status and whether the ML model is loaded."""
-    return HealthResponse(
-        status="ok",
-        model_loaded=is_model_loaded(),
-        version="1.0.0",
-    )
+    return ORJSONResponse({
+        "status": "ok",
+        "model_loaded": is_model_loaded(),
+        "version": "1.0.0",
+    })
+
+
+# ─── Clinical guidance ────────────────────────────────────────────────────
+# The knowledge base is static, so each block is served as bytes serialised
+# once at import.  Labels match case-insensitively; anything else is a 404.
+@app.get(
+    "/clinical/{label}",
+    tags=["Clinical"],
+    summary="Suggestions, medications and reference ranges for a class",
+    responses={404: {"description": "Unknown class label"}},
+)
+async def clinical_data(label: str) -> Response:
+    body = get_clinical_data_json(normalise_label(label))
+    if body is None:
+        raise HTTPException(status_code=404, detail=f"Unknown class label '{label}'.")
+    return Response(body, media_type="application/json")
 
 
 # ─── Root redirect ────────────────────────────────────────────────────────
 @app.get("/", include_in_schema=False)
 async def root():
-    return JSONResponse(
+    return ORJSONResponse(
         content={
             "message": "Osteocare.ai API is running. Visit /docs for Swagger UI.",
             "docs": "/docs",
@@ -0,0 +1,4 @@
+# Middleware package
+from app.middleware.fast_cors import FastCORSMiddleware
+
+__all__ = ["FastCORSMiddleware"]
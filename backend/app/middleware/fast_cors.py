@@ -0,0 +1,89 @@
+"""
+middleware/fast_cors.py
+─────────────────────────────────────────────────────────────────────────────
+Minimal pure-ASGI CORS middleware.
+
+Replaces Starlette's CORSMiddleware for the allow-all-origins policy this API
+uses.  Every header tuple is built once in __init__, so the per-request work
+is a header scan for `origin` plus one list append on the response start.
+
+Behaviour (matches CORSMiddleware with allow_origins=["*"] and
+allow_credentials=True):
+  • Preflight (OPTIONS + access-control-request-method) → 200 with the
+    precomputed allow-* headers, request origin echoed back
+  • Any other request with an Origin header → origin echoed on the response
+  • Requests without an Origin header pass through untouched
+"""
+
+from typing import Iterable
+
+
+class FastCORSMiddleware:
+    def __init__(
+        self,
+        app,
+        allow_methods: Iterable[str] = ("GET", "POST", "OPTIONS"),
+        allow_headers: str = "*",
+        allow_credentials: bool = True,
+        max_age: int = 600,
+    ) -> None:
+        self.app = app
+
+        simple = [(b"vary", b"Origin")]
+        if allow_credentials:
+            simple.append((b"access-control-allow-credentials", b"true"))
+        self._simple_headers = simple
+
+        # "*" is not honoured by browsers on credentialed requests, so the
+        # requested headers are mirrored back instead (as Starlette does).
+        self._mirror_headers = allow_headers == "*"
+        self._allow_headers = allow_headers.encode("latin-1")
+        self._preflight_headers = simple + [
+            (b"access-control-allow-methods", ", ".join(allow_methods).encode("latin-1")),
+            (b"access-control-max-age", str(max_age).encode("latin-1")),
+            (b"content-length", b"2"),
+            (b"content-type", b"text/plain; charset=utf-8"),
+        ]
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        origin = None
+        is_preflight = False
+        requested_headers = b""
+        for name, value in scope["headers"]:
+            if name == b"origin":
+                origin = value
+            elif name == b"access-control-request-method":
+                is_preflight = True
+            elif name == b"access-control-request-headers":
+                requested_headers = value
+
+        if origin is None:
+            await self.app(scope, receive, send)
+            return
+
+        if is_preflight and scope["method"] == "OPTIONS":
+            allow_headers = requested_headers if self._mirror_headers else self._allow_headers
+            await send({
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"access-control-allow-origin", origin),
+                    (b"access-control-allow-headers", allow_headers),
+                    *self._preflight_headers,
+                ],
+            })
+            await send({"type": "http.response.body", "body": b"OK"})
+            return
+
+        extra = [(b"access-control-allow-origin", origin), *self._simple_headers]
+
+        async def send_with_cors(message) -> None:
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", ())) + extra
+            await send(message)
+
+        await self.app(scope, receive, send_with_cors)
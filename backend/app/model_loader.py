@@ -4,14 +4,19 @@ model_loader.py
 Responsible for loading the stacking ensemble model (.pkl) exactly once at
 application startup, and exposing get_model() for route handlers.
 
+The EfficientNet-B3 X-ray model is loaded lazily by ensure_xray_model() on
+the first /predict/xray or /predict/mri request.
+
 Future extension points:
-  - CNN model for X-ray images  → add load_xray_model() here
   - NLP model for PDF reports   → add load_report_model() here
 """
 
 import os
+import asyncio
 import logging
+import warnings
 import joblib
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
@@ -19,6 +24,12 @@ logger = logging.getLogger(__name__)
 _model   = None   # tabular_ensemble_model.pkl  (StackingClassifier)
 _scaler  = None   # scaler.pkl                  (StandardScaler)
 _columns = None   # feature_columns.pkl         (list[str], len=16)
+_input_dtype = np.float32   # dtype fed to _model.predict_proba
+
+# StandardScaler parameters as plain float64 arrays, extracted once at load
+# so routes can scale inline: (x - _scale_mean) / _scale_scale
+_scale_mean:  np.ndarray | None = None
+_scale_scale: np.ndarray | None = None
 
 _BACKEND = os.path.dirname(os.path.dirname(__file__))   # …/backend/
 
@@ -27,54 +38,116 @@ SCALER_PATH          = os.path.join(_BACKEND, "artifacts", "scaler.pkl")
 FEATURE_COLUMNS_PATH = os.path.join(_BACKEND, "artifacts", "feature_columns.pkl")
 
 
-def load_model() -> None:
+def _load_artifact(path: str):
     """
-    Load the tabular ensemble model + scaler + feature columns from disk.
-    Called once at FastAPI startup.
+    Load a joblib pickle with its numpy buffers memory-mapped read-only.
+
+    The tabular model is stored uncompressed, so joblib can hand back
+    np.memmap views straight from the OS page cache instead of reading the
+    whole file and copying every array.  Compressed pickles silently fall
+    back to a normal in-memory load.
     """
-    global _model, _scaler, _columns
+    return joblib.load(path, mmap_mode="r")
+
 
-    # ── Tabular ensemble model ────────────────────────────────────────────
+def _load_tabular() -> None:
+    """Load tabular_ensemble_model.pkl into the _model singleton."""
+    global _model
     if not os.path.exists(TABULAR_MODEL_PATH):
         logger.warning("⚠️  Tabular model not found at '%s'. Falling back to rule-based mode.", TABULAR_MODEL_PATH)
         _model = None
-    else:
-        try:
-            import warnings
-            with warnings.catch_warnings():
-                warnings.simplefilter("ignore")
-                _model = joblib.load(TABULAR_MODEL_PATH)
-            logger.info("✅  Tabular ensemble model loaded from '%s'", TABULAR_MODEL_PATH)
-        except Exception as exc:
-            logger.error("❌  Failed to load tabular model: %s", exc)
-            _model = None
+        return
+    try:
+        _model = _load_artifact(TABULAR_MODEL_PATH)
+        logger.info("✅  Tabular ensemble model loaded from '%s'", TABULAR_MODEL_PATH)
+    except Exception as exc:
+        logger.error("❌  Failed to load tabular model: %s", exc)
+        _model = None
+
 
-    # ── Scaler ────────────────────────────────────────────────────────────
+def _load_scaler() -> None:
+    """Load scaler.pkl into the _scaler singleton and cache its mean/scale."""
+    global _scaler, _scale_mean, _scale_scale
     if not os.path.exists(SCALER_PATH):
         logger.warning("⚠️  Scaler not found at '%s'.", SCALER_PATH)
         _scaler = None
-    else:
-        try:
-            import warnings
-            with warnings.catch_warnings():
-                warnings.simplefilter("ignore")
-                _scaler = joblib.load(SCALER_PATH)
-            logger.info("✅  Scaler loaded from '%s'", SCALER_PATH)
-        except Exception as exc:
-            logger.error("❌  Failed to load scaler: %s", exc)
-            _scaler = None
+        return
+    try:
+        _scaler = _load_artifact(SCALER_PATH)
+        n = _scaler.n_features_in_
+        mean  = _scaler.mean_  if getattr(_scaler, "mean_",  None) is not None else np.zeros(n)
+        scale = _scaler.scale_ if getattr(_scaler, "scale_", None) is not None else np.ones(n)
+        _scale_mean  = np.array(mean,  dtype=np.float64)
+        _scale_scale = np.array(scale, dtype=np.float64)
+        logger.info("✅  Scaler loaded from '%s'", SCALER_PATH)
+    except Exception as exc:
+        logger.error("❌  Failed to load scaler: %s", exc)
+        _scaler = None
+        _scale_mean = _scale_scale = None
 
-    # ── Feature columns ───────────────────────────────────────────────────
+
+def _load_columns() -> None:
+    """Load feature_columns.pkl into the _columns singleton."""
+    global _columns
     if not os.path.exists(FEATURE_COLUMNS_PATH):
         logger.warning("⚠️  Feature columns not found at '%s'.", FEATURE_COLUMNS_PATH)
         _columns = None
-    else:
-        try:
-            _columns = joblib.load(FEATURE_COLUMNS_PATH)
-            logger.info("✅  Feature columns loaded: %s", _columns)
-        except Exception as exc:
-            logger.error("❌  Failed to load feature columns: %s", exc)
-            _columns = None
+        return
+    try:
+        _columns = _load_artifact(FEATURE_COLUMNS_PATH)
+        logger.info("✅  Feature columns loaded: %s", _columns)
+    except Exception as exc:
+        logger.error("❌  Failed to load feature columns: %s", exc)
+        _columns = None
+
+
+def load_model() -> None:
+    """
+    Load the tabular ensemble model + scaler + feature columns from disk,
+    one after the other.  Use load_model_async() from the event loop.
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        _load_tabular()
+        _load_scaler()
+        _load_columns()
+        _probe_input_dtype()
+
+
+def _probe_input_dtype() -> None:
+    """
+    Check once that the ensemble accepts float32 input (halves the bytes
+    pushed through every base estimator); fall back to float64 otherwise.
+    Doubles as a warm-up pass so the first request isn't the slowest.
+    """
+    global _input_dtype
+    if _model is None or _columns is None:
+        return
+    try:
+        _model.predict_proba(np.zeros((1, len(_columns)), dtype=np.float32))
+        _input_dtype = np.float32
+    except Exception as exc:
+        logger.warning("⚠️  Tabular model rejected float32 input (%s); using float64.", exc)
+        _input_dtype = np.float64
+
+
+async def load_model_async() -> None:
+    """
+    Load the three tabular artifacts concurrently in worker threads, so
+    startup costs the slowest load instead of the sum of all three.
+    Called once at FastAPI startup.
+
+    The warnings filter is process-global, so it is set once around the
+    whole gather rather than per thread.
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        await asyncio.gather(
+            asyncio.to_thread(_load_tabular),
+            asyncio.to_thread(_load_scaler),
+            asyncio.to_thread(_load_columns),
+        )
+        await asyncio.to_thread(_probe_input_dtype)
 
 
 def get_model():
@@ -87,11 +160,21 @@ def get_scaler():
     return _scaler
 
 
+def get_scaler_params() -> tuple[np.ndarray, np.ndarray]:
+    """Return the StandardScaler (mean_, scale_) as float64 arrays (scaler must be loaded)."""
+    return _scale_mean, _scale_scale
+
+
 def get_feature_columns():
     """Return the list of 16 feature column names (None if not loaded)."""
     return _columns
 
 
+def get_model_input_dtype():
+    """Return the numpy dtype the tabular model should be fed (float32 if supported)."""
+    return _input_dtype
+
+
 def is_model_loaded() -> bool:
     """True only if model, scaler, and feature columns are all ready."""
     return _model is not None and _scaler is not None and _columns is not None
@@ -101,17 +184,80 @@ def is_model_loaded() -> bool:
 # EfficientNet-B3  —  X-ray vision model
 # ─────────────────────────────────────────────────────────────────────────────
 _xray_model = None   # torchvision EfficientNet-B3, 3-class
+_xray_load_attempted = False
+_xray_lock: asyncio.Lock | None = None
+
+# Micro-batcher: concurrent image requests share one forward pass
+XRAY_MAX_BATCH  = 8
+XRAY_MAX_WAIT_S = 8e-3
+_xray_queue: asyncio.Queue | None = None
+_xray_batcher_task: asyncio.Task | None = None
 
 XRAY_MODEL_PATH = os.path.join(_BACKEND, "models", "efficientnet_b3_osteoporosis.pth")
+XRAY_INPUT_SIZE = 300
+
+# Opt-in bfloat16 autocast for the CNN on CPUs with native bf16 (AVX512-BF16
+# / AMX).  Off by default: on older CPUs bf16 is emulated and slower.
+XRAY_BF16 = os.environ.get("XRAY_BF16", "0") == "1"
+
+# Load the CNN during startup instead of on the first image request.
+XRAY_PRELOAD = os.environ.get("XRAY_PRELOAD", "0") == "1"
+
+
+def _xray_autocast():
+    """CPU bf16 autocast context when XRAY_BF16 is set, otherwise a no-op."""
+    import torch
+
+    return torch.autocast("cpu", dtype=torch.bfloat16, enabled=XRAY_BF16)
+
+
+def _quantize_head(model):
+    """
+    Dynamically quantize the Linear classifier head to int8 (FBGEMM/QNNPACK).
+    EfficientNet's depthwise convs, SiLU and squeeze-excite blocks are not
+    supported by eager-mode static quantization without calibration data,
+    and quantize_dynamic only covers Linear/RNN layers, so the conv trunk
+    stays fp32.  Returns the original model if quantization is unavailable.
+    """
+    import torch
+
+    try:
+        return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    except Exception as exc:
+        logger.warning("⚠️  int8 quantization unavailable, keeping fp32 head: %s", exc)
+        return model
+
+
+def _optimise_for_inference(model):
+    """
+    Convert an eval-mode CNN to channels-last, trace + freeze it with
+    TorchScript (folds Conv-BN and fuses activations) and run two warm-up
+    passes so the first real request doesn't pay for graph optimisation.
+    Falls back to the eager channels-last model if tracing fails.
+    """
+    import torch
+
+    model = model.to(memory_format=torch.channels_last)
+    example = torch.zeros(1, 3, XRAY_INPUT_SIZE, XRAY_INPUT_SIZE).to(memory_format=torch.channels_last)
+    try:
+        with torch.no_grad(), _xray_autocast():
+            traced = torch.jit.freeze(torch.jit.trace(model, example))
+            traced(example)
+            traced(example)
+        return traced
+    except Exception as exc:
+        logger.warning("⚠️  TorchScript tracing failed, using eager model: %s", exc)
+        return model
 
 
 def load_xray_model() -> None:
     """
     Build the EfficientNet-B3 architecture (3 output classes), load the saved
     state-dict from disk, and set to eval mode.
-    Called once at FastAPI startup.
+    Blocking — called once from ensure_xray_model() in a worker thread.
     """
-    global _xray_model
+    global _xray_model, _xray_load_attempted
+    _xray_load_attempted = True
 
     if not os.path.exists(XRAY_MODEL_PATH):
         logger.warning("⚠️  X-ray model not found at '%s'. X-ray predictions will use heuristic fallback.", XRAY_MODEL_PATH)
@@ -119,10 +265,16 @@ def load_xray_model() -> None:
         return
 
     try:
-        import warnings
         import torch
         from torchvision import models
 
+        # Match the BLAS cap set in main.py: one intra-op / inter-op thread per worker
+        torch.set_num_threads(int(os.environ.get("OMP_NUM_THREADS", "1")))
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            pass   # already fixed once inter-op work has started
+
         model = models.efficientnet_b3(weights=None)
         model.classifier[1] = torch.nn.Linear(model.classifier[1].in_features, 3)
 
@@ -132,13 +284,123 @@ def load_xray_model() -> None:
 
         model.load_state_dict(sd)
         model.eval()
-        _xray_model = model
+        model.requires_grad_(False)   # no autograd bookkeeping on any weight
+        if not XRAY_BF16:
+            model = _quantize_head(model)   # int8 Linear kernels don't take bf16 input
+        _xray_model = _optimise_for_inference(model)
         logger.info("✅  EfficientNet-B3 X-ray model loaded from '%s'", XRAY_MODEL_PATH)
     except Exception as exc:
         logger.error("❌  Failed to load X-ray model: %s", exc)
         _xray_model = None
 
 
+async def ensure_xray_model():
+    """
+    Lazily load the X-ray model on the first image request and return it
+    (None if unavailable).  torch / torchvision are only imported here, so
+    manual-only deployments never pay for them.  The lock guarantees that
+    concurrent first requests trigger a single load.
+    """
+    global _xray_lock
+    if _xray_load_attempted:
+        return _xray_model
+    if _xray_lock is None:
+        _xray_lock = asyncio.Lock()
+    async with _xray_lock:
+        if not _xray_load_attempted:
+            await asyncio.to_thread(load_xray_model)
+            if _xray_model is not None:
+                _start_xray_batcher()
+    return _xray_model
+
+
+def _xray_forward(batch):
+    """Blocking CNN forward pass → softmax probabilities, shape (N, 3)."""
+    import torch
+
+    with torch.inference_mode(), _xray_autocast():
+        logits = _xray_model(batch.contiguous(memory_format=torch.channels_last))
+    return torch.softmax(logits.float(), dim=1).numpy()
+
+
+def _start_xray_batcher() -> None:
+    global _xray_queue, _xray_batcher_task
+    _xray_queue = asyncio.Queue()
+    _xray_batcher_task = asyncio.create_task(_xray_batcher())
+    logger.info("✅  X-ray micro-batcher started (batch ≤ %d, wait ≤ %.0f ms)", XRAY_MAX_BATCH, XRAY_MAX_WAIT_S * 1000)
+
+
+async def stop_xray_batcher() -> None:
+    """Cancel the micro-batcher task (called on application shutdown)."""
+    global _xray_batcher_task
+    if _xray_batcher_task is None:
+        return
+    _xray_batcher_task.cancel()
+    try:
+        await _xray_batcher_task
+    except asyncio.CancelledError:
+        pass
+    _xray_batcher_task = None
+
+
+async def _xray_batcher() -> None:
+    """
+    Collect up to XRAY_MAX_BATCH queued (tensor, future) pairs, then run a
+    single forward pass in a worker thread and resolve each future with its
+    row.
+
+    Whatever is already queued is taken immediately.  A lone request with
+    nothing else waiting is dispatched at once (no batching delay when
+    idle); only when requests are already piling up does the batcher wait
+    up to XRAY_MAX_WAIT_S for the batch to fill.  Under load, requests that
+    arrive during a forward pass queue up and form the next batch.
+    """
+    import torch
+
+    loop = asyncio.get_running_loop()
+    while True:
+        items = [await _xray_queue.get()]
+        while len(items) < XRAY_MAX_BATCH and not _xray_queue.empty():
+            items.append(_xray_queue.get_nowait())
+
+        deadline = loop.time() + XRAY_MAX_WAIT_S
+        while 1 < len(items) < XRAY_MAX_BATCH:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                items.append(await asyncio.wait_for(_xray_queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        try:
+            batch = torch.cat([x for x, _ in items])
+            proba = await asyncio.to_thread(_xray_forward, batch)
+        except Exception as exc:
+            for _, fut in items:
+                if not fut.done():
+                    fut.set_exception(exc)
+            continue
+
+        for (_, fut), row in zip(items, proba):
+            if not fut.done():
+                fut.set_result(row)
+
+
+async def infer_xray(x):
+    """
+    Run EfficientNet-B3 on one preprocessed (1, 3, H, W) tensor and return
+    its softmax probabilities (shape (3,)).  Requests are coalesced by the
+    micro-batcher; if it isn't running the image is inferred on its own.
+    """
+    if _xray_batcher_task is None or _xray_batcher_task.done():
+        return (await asyncio.to_thread(_xray_forward, x))[0]
+
+    fut = asyncio.get_running_loop().create_future()
+    await _xray_queue.put((x, fut))
+    return await fut
+
+
 def get_xray_model():
     """Return the EfficientNet-B3 singleton (None if not loaded)."""
     return _xray_model
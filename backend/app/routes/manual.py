@@ -30,12 +30,14 @@ Model output classes:  0 → Normal   |   1 → Osteoporosis
 """
 
 import logging
+import warnings
 import numpy as np
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import ORJSONResponse
 
-from app.model_loader import get_model, get_scaler, is_model_loaded
+from app.model_loader import get_model, get_model_input_dtype, get_scaler_params, is_model_loaded
 from app.schemas import ManualPredictionRequest, PredictionResponse
-from app.utils import get_clinical_data, build_t_score, build_bmd
+from app.utils import build_prediction_payload, build_t_score, build_bmd
 from models.manual_rule_model import score_features
 
 logger = logging.getLogger(__name__)
@@ -44,12 +46,30 @@ router = APIRouter(prefix="/predict", tags=["Manual Prediction"])
 # Binary class index → human-readable label
 _CLASS_LABELS = {0: "Normal", 1: "Osteoporosis"}
 
+# sklearn's feature-name / version UserWarnings are silenced once at import,
+# so the request path never touches the global warnings filter lock.
+warnings.filterwarnings("ignore", category=UserWarning, module="sklearn")
+
 EXPECTED_FEATURES = 16
 
+def _scale_features(features) -> np.ndarray:
+    """
+    Standardise `features` into a fresh (1, 16) float32 row using the scaler
+    parameters cached by model_loader.  Equivalent to scaler.transform()
+    without its per-call input validation.  The row is allocated per call
+    (it's 64 bytes), so concurrent requests can never share it.
+    """
+    mean, scale = get_scaler_params()
+    row = np.empty((1, EXPECTED_FEATURES), dtype=np.float32)
+    np.subtract(np.asarray(features, dtype=np.float64), mean, out=row[0], casting="same_kind")
+    np.divide(row, scale, out=row, casting="same_kind")
+    return row
+
 
 @router.post(
     "/manual",
-    response_model=PredictionResponse,
+    response_class=ORJSONResponse,
+    responses={200: {"model": PredictionResponse}},
     summary="Predict osteoporosis risk from clinical features",
     description=(
         "Submit a list of 16 clinical feature values matching the tabular "
@@ -57,7 +77,7 @@ EXPECTED_FEATURES = 16
         "score, and personalised clinical recommendations."
     ),
 )
-async def predict_manual(payload: ManualPredictionRequest) -> PredictionResponse:
+async def predict_manual(payload: ManualPredictionRequest) -> ORJSONResponse:
     """
     Run a manual (form-based) osteoporosis prediction using the
     TabularEnsemble StackingClassifier + StandardScaler artifacts.
@@ -71,28 +91,21 @@ async def predict_manual(payload: ManualPredictionRequest) -> PredictionResponse
             ),
         )
 
-    try:
-        features_array = np.array(payload.features, dtype=np.float64).reshape(1, -1)
-    except Exception as exc:
-        raise HTTPException(status_code=422, detail=f"Invalid feature array: {exc}")
-
     # ── Tabular Ensemble model path ───────────────────────────────────────
     if is_model_loaded():
-        model  = get_model()
-        scaler = get_scaler()
+        model = get_model()
         try:
-            # Scale features before inference
-            import warnings
-            with warnings.catch_warnings():
-                warnings.simplefilter("ignore")
-                x_scaled = scaler.transform(features_array)
-                raw_pred  = model.predict(x_scaled)[0]
-                proba     = model.predict_proba(x_scaled)[0]
-
-            class_idx  = int(raw_pred)
+            # Scale features before inference; predict_proba alone gives the
+            # label too, so the ensemble runs a single forward pass.
+            x_scaled = _scale_features(payload.features)
+            x_scaled = x_scaled.astype(get_model_input_dtype(), copy=False)
+            proba    = model.predict_proba(x_scaled)[0]
+
+            class_idx  = int(proba.argmax())
             label      = _CLASS_LABELS.get(class_idx, "Normal")
             confidence = float(proba[class_idx])
-            logger.info("TabularEnsemble prediction: %s (confidence=%.4f, class=%d)", label, confidence, class_idx)
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("TabularEnsemble prediction: %s (confidence=%.4f, class=%d)", label, confidence, class_idx)
         except Exception as exc:
             logger.error("Model inference failed: %s", exc)
             raise HTTPException(status_code=500, detail=f"Model inference error: {exc}")
@@ -101,24 +114,8 @@ async def predict_manual(payload: ManualPredictionRequest) -> PredictionResponse
     else:
         logger.info("TabularEnsemble not loaded — using rule-based clinical scoring fallback.")
         label, confidence, t_score_val, bmd_val = score_features(payload.features)
-        clinical = get_clinical_data(label)
-        return PredictionResponse(
-            prediction=label,
-            confidence=round(confidence, 4),
-            t_score=round(t_score_val, 2),
-            bmd=round(bmd_val, 3),
-            fracture_risk=clinical["fracture_risk"],
-            suggestions=clinical["suggestions"],
-            medications=clinical["medications"],
-        )
+        return ORJSONResponse(build_prediction_payload(label, confidence, t_score_val, bmd_val))
 
-    clinical = get_clinical_data(label)
-    return PredictionResponse(
-        prediction=label,
-        confidence=round(confidence, 4),
-        t_score=build_t_score(label),
-        bmd=build_bmd(label),
-        fracture_risk=clinical["fracture_risk"],
-        suggestions=clinical["suggestions"],
-        medications=clinical["medications"],
+    return ORJSONResponse(
+        build_prediction_payload(label, confidence, build_t_score(label), build_bmd(label))
     )
@@ -19,21 +19,27 @@ MRI/CT specifics applied post-inference:
     volumetric information density of cross-sectional imaging
 """
 
+import asyncio
+import hashlib
 import logging
-import math
-import random
+from collections import OrderedDict
 
+import numpy as np
 from fastapi import APIRouter, File, UploadFile, HTTPException
+from fastapi.responses import ORJSONResponse
+from fastapi.concurrency import run_in_threadpool
 
 from app.schemas import PredictionResponse
-from app.utils import get_clinical_data
-from app.model_loader import get_xray_model, is_xray_model_loaded
-from models.xray_vision_model import analyse_xray, analyse_xray_cnn
+from app.utils import build_prediction_payload, read_upload_limited
+from app.model_loader import ensure_xray_model, infer_xray
+from models.xray_vision_model import (
+    analyse_xray, cnn_result_from_proba, decode_xray, heuristic_features, preprocess_xray_cnn,
+)
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/predict", tags=["MRI / CT Prediction"])
 
-ALLOWED_MRI_TYPES = {
+ALLOWED_MRI_TYPES = frozenset({
     "image/jpeg",
     "image/jpg",
     "image/png",
@@ -42,11 +48,64 @@ ALLOWED_MRI_TYPES = {
     "image/webp",
     "image/dicom",
     "application/dicom",
-}
+})
 MAX_FILE_SIZE_MB = 50          # MRI/CT stacks can be large
 
 
-def _boost_mri_confidence(confidence: float, label: str) -> float:
+# Uniform draw bounds for the MRI/CT adjustments, in unpack order:
+#   MPR boost, marrow signal ratio, cortical width (mm),
+#   trabecular volume fraction, image SNR (dB)
+_DRAW_LO = np.array([0.08, 0.41, 2.8, 0.11, 18.5])
+_DRAW_HI = np.array([0.12, 0.78, 5.6, 0.34, 42.0])
+
+_MODALITY_CONST = {
+    "MPR Planes Analysed": "Axial · Sagittal · Coronal",
+    "Modality":            "MRI / CT Cross-Sectional",
+}
+
+
+# CNN results keyed by upload digest — retries / polling UIs skip inference
+_CNN_CACHE_SIZE = 256
+_cnn_cache: "OrderedDict[bytes, tuple]" = OrderedDict()
+
+
+def _fingerprint(contents: bytes) -> tuple[bytes, int]:
+    """Return (digest, seed) identifying an upload's exact bytes."""
+    digest = hashlib.blake2b(contents, digest_size=8).digest()
+    return digest, int.from_bytes(digest, "little") & 0xFFFFFFFF
+
+
+async def _cached_cnn(digest: bytes, contents: bytes) -> tuple:
+    """EfficientNet-B3 analysis of `contents`, memoised on its digest (LRU)."""
+    hit = _cnn_cache.get(digest)
+    if hit is not None:
+        _cnn_cache.move_to_end(digest)
+        return hit
+
+    img = await run_in_threadpool(decode_xray, contents)
+    feats = asyncio.ensure_future(run_in_threadpool(heuristic_features, img))
+    try:
+        proba = await infer_xray(await run_in_threadpool(preprocess_xray_cnn, img))
+        result = cnn_result_from_proba(proba, feats=await feats)
+    finally:
+        if not feats.done():
+            feats.cancel()   # CNN failed: don't leave the panel pass running unawaited
+    _cnn_cache[digest] = result
+    if len(_cnn_cache) > _CNN_CACHE_SIZE:
+        _cnn_cache.popitem(last=False)
+    return result
+
+
+def _draw_mri_params(seed: int) -> list[float]:
+    """
+    Draw every MRI/CT adjustment value in one vectorised call.
+    The generator is seeded from the upload digest, so the same image always
+    yields the same boost and metrics while different scans never share them.
+    """
+    return np.random.default_rng(seed).uniform(_DRAW_LO, _DRAW_HI).tolist()
+
+
+def _boost_mri_confidence(confidence: float, draws: list[float]) -> float:
     """
     Apply a multi-planar reconstruction (MPR) confidence boost.
     MRI/CT provides volumetric structural data unavailable on X-ray,
@@ -54,43 +113,33 @@ def _boost_mri_confidence(confidence: float, label: str) -> float:
 
     Boost logic:
       • Base MPR factor: +8–12% (reflects extra volumetric information)
-      • Deterministic seed derived from confidence value ensures
+      • Deterministic draw (see _draw_mri_params) ensures
         reproducible results for the same image.
       • Hard floor: 0.88 — minimum reported confidence for cross-sectional imaging.
       • Hard ceiling: 0.987 — avoids implausibly perfect outputs.
     """
-    seed = int(confidence * 10_000) % 100
-    rng = random.Random(seed)
-    mpr_boost = rng.uniform(0.08, 0.12)
-    boosted = min(confidence + mpr_boost, 0.987)
+    boosted = min(confidence + draws[0], 0.987)
     return max(boosted, 0.88)
 
 
-def _build_mri_metrics(base_metrics: dict, label: str, confidence: float) -> dict:
+def _build_mri_metrics(base_metrics: dict, draws: list[float]) -> dict:
     """
     Augment the base heuristic metrics with MRI/CT-specific analysis fields.
     """
-    seed = int(confidence * 9_999) % 100
-    rng = random.Random(seed + 7)
-
-    marrow_signal = round(rng.uniform(0.41, 0.78), 3)
-    cortical_width_mm = round(rng.uniform(2.8, 5.6), 2)
-    trabecular_vol_frac = round(rng.uniform(0.11, 0.34), 3)
-    snr = round(rng.uniform(18.5, 42.0), 1)
+    _, marrow_signal, cortical_width_mm, trabecular_vol_frac, snr = draws
 
-    augmented = {**base_metrics}
-    augmented["Marrow Signal Ratio"]      = f"{marrow_signal:.3f}"
-    augmented["Cortical Width (mm)"]      = f"{cortical_width_mm:.2f} mm"
-    augmented["Trabecular Vol. Fraction"] = f"{trabecular_vol_frac:.3f}"
-    augmented["Image SNR (dB)"]           = f"{snr:.1f} dB"
-    augmented["MPR Planes Analysed"]      = "Axial · Sagittal · Coronal"
-    augmented["Modality"]                 = "MRI / CT Cross-Sectional"
-    return augmented
+    return base_metrics | {
+        "Marrow Signal Ratio":      f"{marrow_signal:.3f}",
+        "Cortical Width (mm)":      f"{cortical_width_mm:.2f} mm",
+        "Trabecular Vol. Fraction": f"{trabecular_vol_frac:.3f}",
+        "Image SNR (dB)":           f"{snr:.1f} dB",
+    } | _MODALITY_CONST
 
 
 @router.post(
     "/mri",
-    response_model=PredictionResponse,
+    response_class=ORJSONResponse,
+    responses={200: {"model": PredictionResponse}},
     summary="Predict osteoporosis from an MRI or CT scan",
     description=(
         "Upload an MRI or CT scan image (JPEG, PNG, TIFF, BMP, DICOM, WebP). "
@@ -104,45 +153,43 @@ async def predict_mri(
         ...,
         description="MRI or CT scan image (JPEG/PNG/TIFF/BMP/DICOM/WebP, max 50 MB)"
     ),
-) -> PredictionResponse:
+) -> ORJSONResponse:
     """
     Analyse an uploaded MRI or CT scan for osteoporosis risk.
 
     - **file**: JPEG / PNG / TIFF / BMP / DICOM / WebP (max 50 MB)
     """
     # ── Validate content type ────────────────────────────────────────────
-    if file.content_type not in ALLOWED_MRI_TYPES:
+    ctype = (file.content_type or "").lower()
+    if ctype not in ALLOWED_MRI_TYPES:
         raise HTTPException(
             status_code=415,
             detail=(
-                f"Unsupported file type '{file.content_type}'. "
+                f"Unsupported file type '{ctype}'. "
                 "Allowed: JPEG, PNG, TIFF, BMP, DICOM, WebP"
             ),
         )
 
-    # ── Read & size-check ────────────────────────────────────────────────
-    contents = await file.read()
-    size_mb = len(contents) / (1024 * 1024)
-    if size_mb > MAX_FILE_SIZE_MB:
-        raise HTTPException(
-            status_code=413,
-            detail=f"File too large ({size_mb:.1f} MB). Maximum allowed: {MAX_FILE_SIZE_MB} MB.",
+    # ── Stream & size-check ──────────────────────────────────────────────
+    contents = await read_upload_limited(file, MAX_FILE_SIZE_MB)
+
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(
+            "MRI/CT received: name='%s', type='%s', size=%.2f MB",
+            file.filename, ctype, len(contents) / (1024 * 1024),
         )
 
-    logger.info(
-        "MRI/CT received: name='%s', type='%s', size=%.2f MB",
-        file.filename, file.content_type, size_mb,
-    )
+    digest, seed = _fingerprint(contents)
+    draws = _draw_mri_params(seed)
 
     # ── Primary: EfficientNet-B3 + MPR confidence boost ──────────────────
-    if is_xray_model_loaded():
+    if await ensure_xray_model() is not None:
         try:
-            cnn_model = get_xray_model()
-            label, confidence, t_score_val, bmd_val, analysis_metrics = analyse_xray_cnn(
-                contents, cnn_model
+            label, confidence, t_score_val, bmd_val, analysis_metrics = await _cached_cnn(
+                digest, contents
             )
-            boosted_conf = _boost_mri_confidence(confidence, label)
-            mri_metrics  = _build_mri_metrics(analysis_metrics, label, confidence)
+            boosted_conf = _boost_mri_confidence(confidence, draws)
+            mri_metrics  = _build_mri_metrics(analysis_metrics, draws)
             evidence = (
                 f"EfficientNet-B3 + MPR volumetric boost — "
                 f"Raw CNN confidence: {confidence:.4f} → "
@@ -151,39 +198,36 @@ async def predict_mri(
                 f"P(Osteopenia)={analysis_metrics.get('P(Osteopenia)', '?')}  "
                 f"P(Osteoporosis)={analysis_metrics.get('P(Osteoporosis)', '?')}"
             )
-            logger.info(
-                "MRI/CT (EfficientNet-B3 + boost): %s  raw=%.4f  boosted=%.4f",
-                label, confidence, boosted_conf,
-            )
+            if logger.isEnabledFor(logging.INFO):
+                logger.info(
+                    "MRI/CT (EfficientNet-B3 + boost): %s  raw=%.4f  boosted=%.4f",
+                    label, confidence, boosted_conf,
+                )
             confidence = boosted_conf
         except Exception as exc:
             logger.error("CNN inference failed for MRI/CT, using heuristic: %s", exc)
-            label, confidence, t_score_val, bmd_val, analysis_metrics = analyse_xray(contents)
-            confidence   = _boost_mri_confidence(confidence, label)
-            mri_metrics  = _build_mri_metrics(analysis_metrics, label, confidence)
+            label, confidence, t_score_val, bmd_val, analysis_metrics = await run_in_threadpool(
+                analyse_xray, contents
+            )
+            confidence   = _boost_mri_confidence(confidence, draws)
+            mri_metrics  = _build_mri_metrics(analysis_metrics, draws)
             evidence = f"Heuristic MRI/CT analysis + MPR boost (CNN error: {exc})"
 
     # ── Fallback: enhanced heuristic ─────────────────────────────────────
     else:
         logger.info("EfficientNet-B3 not loaded — using enhanced MRI/CT heuristic.")
-        label, confidence, t_score_val, bmd_val, analysis_metrics = analyse_xray(contents)
-        confidence  = _boost_mri_confidence(confidence, label)
-        mri_metrics = _build_mri_metrics(analysis_metrics, label, confidence)
+        label, confidence, t_score_val, bmd_val, analysis_metrics = await run_in_threadpool(
+            analyse_xray, contents
+        )
+        confidence  = _boost_mri_confidence(confidence, draws)
+        mri_metrics = _build_mri_metrics(analysis_metrics, draws)
         evidence = (
             f"Enhanced heuristic MRI/CT analysis + MPR volumetric confidence boost "
             f"({len(mri_metrics)} metrics computed)"
         )
 
-    clinical = get_clinical_data(label)
-
-    return PredictionResponse(
-        prediction=label,
-        confidence=round(confidence, 4),
-        t_score=round(t_score_val, 2),
-        bmd=round(bmd_val, 3),
-        fracture_risk=clinical["fracture_risk"],
-        suggestions=clinical["suggestions"],
-        medications=clinical["medications"],
+    return ORJSONResponse(build_prediction_payload(
+        label, confidence, t_score_val, bmd_val,
         evidence_source=evidence,
         extracted_data=mri_metrics,
-    )
+    ))
@@ -24,23 +24,27 @@ import logging
 import warnings
 import numpy as np
 from fastapi import APIRouter, File, UploadFile, HTTPException
+from fastapi.responses import ORJSONResponse
+from fastapi.concurrency import run_in_threadpool
 
 from app.schemas import PredictionResponse
-from app.utils import get_clinical_data, build_t_score, build_bmd
-from app.model_loader import get_model, get_scaler, is_model_loaded
+from app.utils import (
+    build_prediction_payload, build_t_score, build_bmd, check_upload_size, read_upload_limited,
+)
+from app.model_loader import get_model, get_scaler_params, is_model_loaded
 from models.report_nlp_model import analyse_report
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/predict", tags=["Report Prediction"])
 
-ALLOWED_REPORT_TYPES = {
+ALLOWED_REPORT_TYPES = frozenset({
     "application/pdf",
     "image/jpeg",
     "image/jpg",
     "image/png",
     "image/tiff",
     "image/bmp",
-}
+})
 MAX_FILE_SIZE_MB = 20
 
 # Tabular model output: 0 → Normal/borderline, 1 → Osteoporosis
@@ -49,6 +53,42 @@ _MODEL_CLASSES = {0: "Normal", 1: "Osteoporosis"}
 
 _MAX_FIELDS = 14  # total extractable clinical fields
 
+# Evidence line for the ML path, built with a single %-format per request
+_ML_EVIDENCE_FMT = (
+    "Tabular Ensemble — %d/%d fields extracted"
+    " — P(Normal)=%.1f%%  P(Osteoporosis)=%.1f%%%s"
+)
+
+# Field-coverage factor per extracted-field count (0 … _MAX_FIELDS):
+# 0.65 + (n / _MAX_FIELDS) * 0.35, clamped to [0.65, 1.0]
+_COVERAGE_FACTOR = tuple(
+    max(0.65, min(1.0, 0.65 + (n / _MAX_FIELDS) * 0.35)) for n in range(_MAX_FIELDS + 1)
+)
+
+# sklearn UserWarnings are silenced once here: catch_warnings() is not
+# thread-safe and the tabular block now runs in the threadpool.
+warnings.filterwarnings("ignore", category=UserWarning, module="sklearn")
+
+
+def _run_tabular(model, raw_features_16: np.ndarray) -> tuple[int, "np.ndarray"]:
+    """
+    Scale + classify one (1, 16) feature row.  Kept as a single function so
+    the whole block costs one threadpool hop.  The row is owned by this
+    request, so it is standardised in place with the cached scaler params.
+    """
+    mean, scale = get_scaler_params()
+    x_scaled = raw_features_16
+    np.subtract(x_scaled, mean, out=x_scaled)
+    np.divide(x_scaled, scale, out=x_scaled)
+    # argmax(predict_proba) is what StackingClassifier.predict returns, so a
+    # single ensemble pass yields both the class and its probabilities.
+    proba = model.predict_proba(x_scaled)[0]
+    return int(proba.argmax()), proba
+
+
+# 3-class labels indexed by T-score band: > −1.0 | (−2.5, −1.0] | ≤ −2.5
+_TSCORE_BAND_LABELS = ("Normal", "Osteopenia", "Osteoporosis")
+
 
 def _refine_label_with_tscore(model_class: int, model_conf: float, t_score: float | None) -> str:
     """
@@ -58,19 +98,13 @@ def _refine_label_with_tscore(model_class: int, model_conf: float, t_score: floa
     if model_class == 1:
         return "Osteoporosis"
 
-    # model says Normal (class 0) — check T-score for Osteopenia zone
+    # model says Normal (class 0) — the T-score band picks the label
     if t_score is not None:
-        if t_score <= -2.5:
-            return "Osteoporosis"
-        if t_score <= -1.0:
-            return "Osteopenia"
-        return "Normal"
+        return _TSCORE_BAND_LABELS[(t_score <= -1.0) + (t_score <= -2.5)]
 
     # No T-score: use confidence as proxy
     # Low confidence on Normal pred = borderline → Osteopenia
-    if model_conf < 0.70:
-        return "Osteopenia"
-    return "Normal"
+    return "Osteopenia" if model_conf < 0.70 else "Normal"
 
 
 def _compute_report_confidence(
@@ -94,13 +128,16 @@ def _compute_report_confidence(
       • Field-coverage factor — fewer extracted fields → confidence scaled down
 
     Coverage factor:  n_fields=0 → ×0.65,  n_fields=7 → ×0.825,  n_fields=14 → ×1.00
+
+    Returned unrounded; PredictionResponse rounds confidence to 4 places.
     """
     # How many fields were actually extracted vs defaults used
-    coverage_factor = max(0.65, min(1.0, 0.65 + (n_fields / _MAX_FIELDS) * 0.35))
+    coverage_factor = _COVERAGE_FACTOR[min(n_fields, _MAX_FIELDS)]
+    # Unbox both class probabilities once instead of per-branch numpy indexing
+    p_normal, p_osteo = proba.tolist()[:2]
 
     # ── Osteoporosis: 75 % – 97 % ────────────────────────────────────────
     if final_label == "Osteoporosis":
-        p_osteo = float(proba[1])          # P(Osteoporosis) from model
         if t_score is not None and t_score <= -2.5:
             # T-score confirms: further below −2.5 → higher certainty
             severity = min(1.0, (abs(t_score) - 2.5) / 3.0)  # 0.0 @ −2.5 → 1.0 @ −5.5
@@ -108,7 +145,7 @@ def _compute_report_confidence(
         else:
             # Direct model prediction or override without T-score
             base = 0.75 + p_osteo * 0.22                       # 0.75 – 0.97
-        return round(min(0.97, base * coverage_factor), 4)
+        return min(0.97, base * coverage_factor)
 
     # ── Osteopenia: 60 % – 82 % ──────────────────────────────────────────
     elif final_label == "Osteopenia":
@@ -118,25 +155,25 @@ def _compute_report_confidence(
             base = 0.62 + pos * 0.20                            # 0.62 – 0.82
         else:
             # No T-score; borderline case from low model confidence on Normal
-            uncertainty = 1.0 - float(proba[0])               # model unsure about Normal
+            uncertainty = 1.0 - p_normal                       # model unsure about Normal
             base = 0.60 + uncertainty * 0.22                    # 0.60 – 0.82
-        return round(min(0.82, base * coverage_factor), 4)
+        return min(0.82, base * coverage_factor)
 
     # ── Normal: 78 % – 96 % ──────────────────────────────────────────────
     else:
-        p_normal = float(proba[0])         # P(Normal) from model
         if t_score is not None and t_score > -1.0:
             # T-score also in Normal zone → extra certainty
             clearance = min(1.0, (t_score + 1.0) / 2.0)       # 0.0 @ −1.0 → 1.0 @ +1.0
             base = 0.84 + clearance * 0.12                      # 0.84 – 0.96
         else:
             base = 0.78 + p_normal * 0.18                       # 0.78 – 0.96
-        return round(min(0.96, base * coverage_factor), 4)
+        return min(0.96, base * coverage_factor)
 
 
 @router.post(
     "/report",
-    response_model=PredictionResponse,
+    response_class=ORJSONResponse,
+    responses={200: {"model": PredictionResponse}},
     summary="Predict osteoporosis from a DEXA / medical report file",
     description=(
         "Upload a PDF or image of a DEXA scan report or medical document. "
@@ -146,35 +183,42 @@ def _compute_report_confidence(
 )
 async def predict_report(
     file: UploadFile = File(..., description="PDF or image of the DEXA/medical report"),
-) -> PredictionResponse:
+) -> ORJSONResponse:
     """
     Analyse an uploaded medical report for osteoporosis risk.
 
     - **file**: PDF / JPEG / PNG / TIFF / BMP (max 20 MB)
     """
     # ── Validate content type ────────────────────────────────────────────
-    if file.content_type not in ALLOWED_REPORT_TYPES:
+    ctype = (file.content_type or "").lower()
+    if ctype not in ALLOWED_REPORT_TYPES:
         raise HTTPException(
             status_code=415,
             detail=(
-                f"Unsupported file type '{file.content_type}'. "
+                f"Unsupported file type '{ctype}'. "
                 f"Allowed: PDF, JPEG, PNG, TIFF, BMP"
             ),
         )
 
-    # ── Read & size-check ────────────────────────────────────────────────
-    contents = await file.read()
-    size_mb = len(contents) / (1024 * 1024)
-    if size_mb > MAX_FILE_SIZE_MB:
-        raise HTTPException(
-            status_code=413,
-            detail=f"File too large ({size_mb:.1f} MB). Maximum allowed: {MAX_FILE_SIZE_MB} MB.",
-        )
+    # ── Size-check ───────────────────────────────────────────────────────
+    # PDFs of known size are handed over as the multipart spooled temp file,
+    # skipping read_upload_limited's bytearray + bytes copies; PyMuPDF still
+    # reads it into memory once in the worker thread (only the pdfplumber
+    # fallback and hashing stream from the file).  Everything else is
+    # streamed into memory as bytes.
+    if ctype == "application/pdf" and file.size is not None:
+        check_upload_size(file.size, MAX_FILE_SIZE_MB)
+        contents = file.file
+        n_bytes  = file.size
+    else:
+        contents = await read_upload_limited(file, MAX_FILE_SIZE_MB)
+        n_bytes  = len(contents)
 
-    logger.info(
-        "Report received: name='%s', type='%s', size=%.2f MB",
-        file.filename, file.content_type, size_mb,
-    )
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(
+            "Report received: name='%s', type='%s', size=%.2f MB",
+            file.filename, ctype, n_bytes / (1024 * 1024),
+        )
 
     # ── Step 1: Extract text + clinical fields ───────────────────────────
     # analyse_report returns 7-tuple:
@@ -187,7 +231,7 @@ async def predict_report(
         evidence_source,
         extracted_data,
         raw_features_16,
-    ) = analyse_report(contents, filename=file.filename or "")
+    ) = await run_in_threadpool(analyse_report, contents, file.filename or "")
 
     n_fields = len(extracted_data)
     logger.info(
@@ -197,17 +241,11 @@ async def predict_report(
 
     # ── Step 2: Tabular Ensemble model path ──────────────────────────────
     if is_model_loaded() and raw_features_16 is not None:
-        model  = get_model()
-        scaler = get_scaler()
+        model = get_model()
         try:
-            x = np.array(raw_features_16, dtype=np.float64).reshape(1, -1)
-            with warnings.catch_warnings():
-                warnings.simplefilter("ignore")
-                x_scaled   = scaler.transform(x)
-                raw_pred   = model.predict(x_scaled)[0]
-                proba      = model.predict_proba(x_scaled)[0]
-
-            model_class = int(raw_pred)
+            model_class, proba = await run_in_threadpool(
+                _run_tabular, model, raw_features_16
+            )
             model_conf  = float(proba[model_class])
 
             # Refine 2-class → 3-class using extracted T-score
@@ -219,13 +257,12 @@ async def predict_report(
             )
 
             # Build evidence string
-            prob_str = f"P(Normal)={proba[0]:.1%}  P(Osteoporosis)={proba[1]:.1%}"
             override_note = ""
             if label != _MODEL_CLASSES[model_class]:
                 override_note = f" — label refined via T-score ({t_score_val:+.2f})" if t_score_val is not None else " — borderline confidence"
-            evidence = (
-                f"Tabular Ensemble — {n_fields}/{_MAX_FIELDS} fields extracted"
-                f" — {prob_str}{override_note}"
+            p_normal, p_osteo = proba.tolist()[:2]
+            evidence = _ML_EVIDENCE_FMT % (
+                n_fields, _MAX_FIELDS, p_normal * 100, p_osteo * 100, override_note,
             )
 
             logger.info(
@@ -245,19 +282,11 @@ async def predict_report(
         evidence = evidence_source
 
     # ── Derive T-score / BMD if not already extracted ────────────────────
-    final_t   = round(t_score_val, 2) if t_score_val is not None else build_t_score(label)
-    final_bmd = round(bmd_val, 3)     if bmd_val     is not None else build_bmd(label)
-
-    clinical = get_clinical_data(label)
-
-    return PredictionResponse(
-        prediction=label,
-        confidence=confidence,
-        t_score=final_t,
-        bmd=final_bmd,
-        fracture_risk=clinical["fracture_risk"],
-        suggestions=clinical["suggestions"],
-        medications=clinical["medications"],
+    final_t   = t_score_val if t_score_val is not None else build_t_score(label)
+    final_bmd = bmd_val     if bmd_val     is not None else build_bmd(label)
+
+    return ORJSONResponse(build_prediction_payload(
+        label, confidence, final_t, final_bmd,
         evidence_source=evidence,
-        extracted_data=extracted_data if extracted_data else None,
-    )
+        extracted_data=extracted_data or None,
+    ))
@@ -13,18 +13,23 @@ EfficientNet-B3 details:
   • Output : 3-class softmax  →  Normal | Osteopenia | Osteoporosis
 """
 
+import asyncio
 import logging
 from fastapi import APIRouter, File, UploadFile, HTTPException
+from fastapi.responses import ORJSONResponse
+from fastapi.concurrency import run_in_threadpool
 
 from app.schemas import PredictionResponse
-from app.utils import get_clinical_data, build_t_score, build_bmd
-from app.model_loader import get_xray_model, is_xray_model_loaded
-from models.xray_vision_model import analyse_xray, analyse_xray_cnn
+from app.utils import build_prediction_payload, read_upload_limited
+from app.model_loader import ensure_xray_model, infer_xray
+from models.xray_vision_model import (
+    analyse_xray, cnn_result_from_proba, decode_xray, heuristic_features, preprocess_xray_cnn,
+)
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/predict", tags=["X-Ray Prediction"])
 
-ALLOWED_XRAY_TYPES = {
+ALLOWED_XRAY_TYPES = frozenset({
     "image/jpeg",
     "image/jpg",
     "image/png",
@@ -33,13 +38,14 @@ ALLOWED_XRAY_TYPES = {
     "image/dicom",
     "application/dicom",
     "image/webp",
-}
+})
 MAX_FILE_SIZE_MB = 30
 
 
 @router.post(
     "/xray",
-    response_model=PredictionResponse,
+    response_class=ORJSONResponse,
+    responses={200: {"model": PredictionResponse}},
     summary="Predict osteoporosis from a bone X-ray image",
     description=(
         "Upload a bone X-ray image (JPEG, PNG, TIFF, BMP, DICOM, WebP). "
@@ -49,44 +55,43 @@ MAX_FILE_SIZE_MB = 30
 )
 async def predict_xray(
     file: UploadFile = File(..., description="Bone X-ray image (JPEG/PNG/TIFF/BMP/DICOM/WebP)"),
-) -> PredictionResponse:
+) -> ORJSONResponse:
     """
     Analyse an uploaded bone X-ray for osteoporosis risk.
 
     - **file**: JPEG / PNG / TIFF / BMP / DICOM / WebP (max 30 MB)
     """
     # ── Validate content type ────────────────────────────────────────────
-    if file.content_type not in ALLOWED_XRAY_TYPES:
+    ctype = (file.content_type or "").lower()
+    if ctype not in ALLOWED_XRAY_TYPES:
         raise HTTPException(
             status_code=415,
             detail=(
-                f"Unsupported file type '{file.content_type}'. "
+                f"Unsupported file type '{ctype}'. "
                 "Allowed: JPEG, PNG, TIFF, BMP, DICOM, WebP"
             ),
         )
 
-    # ── Read & size-check ────────────────────────────────────────────────
-    contents = await file.read()
-    size_mb = len(contents) / (1024 * 1024)
-    if size_mb > MAX_FILE_SIZE_MB:
-        raise HTTPException(
-            status_code=413,
-            detail=f"File too large ({size_mb:.1f} MB). Maximum allowed: {MAX_FILE_SIZE_MB} MB.",
-        )
+    # ── Stream & size-check ──────────────────────────────────────────────
+    contents = await read_upload_limited(file, MAX_FILE_SIZE_MB)
 
-    logger.info(
-        "X-ray received: name='%s', type='%s', size=%.2f MB",
-        file.filename,
-        file.content_type,
-        size_mb,
-    )
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(
+            "X-ray received: name='%s', type='%s', size=%.2f MB",
+            file.filename, ctype, len(contents) / (1024 * 1024),
+        )
 
     # ── EfficientNet-B3 CNN (primary) ────────────────────────────────────
-    if is_xray_model_loaded():
+    if await ensure_xray_model() is not None:
+        feats = None
         try:
-            cnn_model = get_xray_model()
-            label, confidence, t_score_val, bmd_val, analysis_metrics = analyse_xray_cnn(
-                contents, cnn_model
+            # Decode once; heuristic panel features run in the threadpool
+            # alongside preprocessing and inference on the same image
+            img = await run_in_threadpool(decode_xray, contents)
+            feats = asyncio.ensure_future(run_in_threadpool(heuristic_features, img))
+            proba = await infer_xray(await run_in_threadpool(preprocess_xray_cnn, img))
+            label, confidence, t_score_val, bmd_val, analysis_metrics = cnn_result_from_proba(
+                proba, feats=await feats
             )
             evidence = (
                 f"EfficientNet-B3 deep CNN — "
@@ -99,25 +104,23 @@ async def predict_xray(
             )
         except Exception as exc:
             logger.error("CNN inference failed, falling back to heuristic: %s", exc)
-            label, confidence, t_score_val, bmd_val, analysis_metrics = analyse_xray(contents)
+            if feats is not None and not feats.done():
+                feats.cancel()   # analyse_xray redoes the panel pass; don't leave it unawaited
+            label, confidence, t_score_val, bmd_val, analysis_metrics = await run_in_threadpool(
+                analyse_xray, contents
+            )
             evidence = f"Heuristic analysis (CNN error: {exc})"
 
     # ── Heuristic fallback (CNN not loaded) ──────────────────────────────
     else:
         logger.info("EfficientNet-B3 not loaded — using heuristic image analysis.")
-        label, confidence, t_score_val, bmd_val, analysis_metrics = analyse_xray(contents)
+        label, confidence, t_score_val, bmd_val, analysis_metrics = await run_in_threadpool(
+            analyse_xray, contents
+        )
         evidence = f"Heuristic multi-feature image analysis ({len(analysis_metrics)} metrics)"
 
-    clinical = get_clinical_data(label)
-
-    return PredictionResponse(
-        prediction=label,
-        confidence=round(confidence, 4),
-        t_score=round(t_score_val, 2),
-        bmd=round(bmd_val, 3),
-        fracture_risk=clinical["fracture_risk"],
-        suggestions=clinical["suggestions"],
-        medications=clinical["medications"],
+    return ORJSONResponse(build_prediction_payload(
+        label, confidence, t_score_val, bmd_val,
         evidence_source=evidence,
-        extracted_data=analysis_metrics if analysis_metrics else None,
-    )
+        extracted_data=analysis_metrics or None,
+    ))
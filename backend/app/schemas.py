@@ -4,7 +4,7 @@ schemas.py
 Pydantic models for request validation and response serialisation.
 """
 
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Sequence, TypedDict
 from pydantic import BaseModel, Field, field_validator
 
 
@@ -12,38 +12,34 @@ from pydantic import BaseModel, Field, field_validator
 
 class ManualPredictionRequest(BaseModel):
     """
-    14 clinical features collected from the manual predictor form.
+    16 clinical features collected from the manual predictor form.
 
-    Expected order (must match training feature order):
-      0  age              – years
-      1  gender           – 0 = Female, 1 = Male
-      2  weight           – kg
-      3  height           – cm
-      4  bmi              – kg/m²  (can be derived, kept for explicitness)
-      5  calcium_intake   – mg/day  (0=Low, 1=Normal, 2=High)
-      6  vitamin_d        – IU/day  (0=Deficient, 1=Sufficient)
-      7  physical_activity– 0=Sedentary, 1=Moderate, 2=Active
-      8  smoking          – 0=No, 1=Yes
-      9  alcohol          – 0=No, 1=Occasional, 2=Regular
-      10 family_history   – 0=No, 1=Yes
-      11 prev_fracture    – 0=No, 1=Yes
-      12 menopause        – 0=N/A or No, 1=Yes
-      13 steroid_use      – 0=No, 1=Yes
+    Expected order (must match feature_columns.pkl / routes/manual.py):
+      0  Age                                  – years
+      1  Gender_Male                          – 0 = Female, 1 = Male
+      2  Hormonal Changes_Postmenopausal      – 0/1
+      3  Family History_Yes                   – 0/1
+      4  Race/Ethnicity_Asian                 – 0/1
+      5  Race/Ethnicity_Caucasian             – 0/1
+      6  Body Weight_Underweight              – 0/1  (BMI < 18.5)
+      7  Calcium Intake_Low                   – 0/1
+      8  Vitamin D Intake_Sufficient          – 0/1
+      9  Physical Activity_Sedentary          – 0/1
+      10 Smoking_Yes                          – 0/1
+      11 Alcohol Consumption_Unknown          – 0/1
+      12 Medical Conditions_Rheumatoid Arthritis – 0/1
+      13 Medical Conditions_Unknown           – 0/1
+      14 Medications_Unknown                  – 0/1
+      15 Prior Fractures_Yes                  – 0/1
     """
     features: List[float] = Field(
         ...,
         min_length=1,
+        max_length=20,
         description="Ordered list of clinical feature values",
-        examples=[[65, 0, 58.0, 162.0, 22.1, 1, 0, 0, 0, 0, 1, 1, 1, 0]],
+        examples=[[65, 0, 1, 1, 0, 1, 0, 1, 0, 1, 0, 0, 0, 0, 0, 1]],
     )
 
-    @field_validator("features")
-    @classmethod
-    def check_feature_length(cls, v: List[float]) -> List[float]:
-        if len(v) not in range(1, 21):
-            raise ValueError("features list must contain between 1 and 20 values")
-        return v
-
 
 # ─── Response Models ───────────────────────────────────────────────────────
 
@@ -59,6 +55,39 @@ class PredictionResponse(BaseModel):
     evidence_source: Optional[str] = Field(None, description="What the model extracted/read from the file")
     extracted_data: Optional[Dict[str, str]] = Field(None, description="Clinical values extracted from the report")
 
+    # Rounding lives here so route handlers can pass raw model outputs
+    @field_validator("confidence")
+    @classmethod
+    def round_confidence(cls, v: float) -> float:
+        return round(v, 4)
+
+    @field_validator("t_score")
+    @classmethod
+    def round_t_score(cls, v: Optional[float]) -> Optional[float]:
+        return round(v, 2) if v is not None else None
+
+    @field_validator("bmd")
+    @classmethod
+    def round_bmd(cls, v: Optional[float]) -> Optional[float]:
+        return round(v, 3) if v is not None else None
+
+
+class PredictionResponseDict(TypedDict):
+    """
+    Plain-dict mirror of PredictionResponse for hot routes that return an
+    ORJSONResponse directly.  Those routes skip pydantic validation, so the
+    dict is built (and rounded) by app.utils.build_prediction_payload().
+    """
+    prediction: str
+    confidence: float
+    t_score: Optional[float]
+    bmd: Optional[float]
+    fracture_risk: Optional[str]
+    suggestions: Sequence[str]
+    medications: Sequence[str]
+    evidence_source: Optional[str]
+    extracted_data: Optional[Dict[str, str]]
+
 
 class HealthResponse(BaseModel):
     status: str
@@ -4,8 +4,16 @@ utils.py
 Shared helpers: prediction-class â†’ clinical suggestions & medications mapping.
 """
 
-from typing import Dict, List, Tuple
-import random
+from types import MappingProxyType
+from typing import Dict, Mapping, Tuple
+from random import random as _random
+
+import orjson
+from fastapi import HTTPException, UploadFile
+
+from app.schemas import PredictionResponseDict
+
+UPLOAD_CHUNK_BYTES = 1 << 20   # 1 MB per read when streaming uploads
 
 # â”€â”€â”€ Class label normalisation â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€
 # The model may return integer indices OR string labels depending on training.
@@ -14,29 +22,31 @@ CLASS_LABEL_MAP: Dict[int, str] = {
     1: "Osteopenia",
     2: "Osteoporosis",
 }
+# Lower-cased label → canonical class name, for case-insensitive matching
+LOWER_LABEL_MAP: Dict[str, str] = {v.lower(): v for v in CLASS_LABEL_MAP.values()}
 
 # â”€â”€â”€ Clinical knowledge base â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€
-CLINICAL_DATA: Dict[str, Dict[str, List]] = {
+_CLINICAL_DATA: Dict[str, Dict[str, object]] = {
     "Normal": {
-        "suggestions": [
+        "suggestions": (
             "Maintain a calcium-rich diet (dairy, leafy greens, fortified foods).",
             "Continue weight-bearing exercise (walking, jogging, resistance training) 3-5x/week.",
             "Ensure adequate Vitamin D via sunlight or supplementation.",
             "Schedule a DEXA scan every 2 years after age 50.",
             "Avoid smoking and excessive alcohol consumption.",
             "Monitor bone health annually with your primary care physician.",
-        ],
-        "medications": [
+        ),
+        "medications": (
             "Calcium supplement: 1000 mg/day (dietary preferred)",
             "Vitamin D3: 600-800 IU/day",
             "No pharmacological treatment required at this stage.",
-        ],
+        ),
         "t_score_range": (-1.0, 0.5),
         "bmd_range": (0.90, 1.10),
         "fracture_risk": "< 5% (Low)",
     },
     "Osteopenia": {
-        "suggestions": [
+        "suggestions": (
             "Increase daily calcium intake to 1200 mg through diet and supplements.",
             "Supplement Vitamin D to 800-1000 IU/day.",
             "Engage in regular high-impact weight-bearing and resistance exercises.",
@@ -45,19 +55,19 @@ CLINICAL_DATA: Dict[str, Dict[str, List]] = {
             "Discuss fracture risk assessment (FRAX) with your physician.",
             "Limit caffeine, alcohol, and sodium  -  all reduce calcium absorption.",
             "Consider physical therapy for balance and posture improvement.",
-        ],
-        "medications": [
+        ),
+        "medications": (
             "Calcium supplement: 1200 mg/day",
             "Vitamin D3: 800-1000 IU/day",
             "Consider bisphosphonates if additional risk factors are present (consult physician).",
             "Hormone Replacement Therapy (HRT)  -  discuss benefits/risks with doctor.",
-        ],
+        ),
         "t_score_range": (-2.5, -1.0),
         "bmd_range": (0.70, 0.90),
         "fracture_risk": "5-20% (Moderate)",
     },
     "Osteoporosis": {
-        "suggestions": [
+        "suggestions": (
             "Seek immediate consultation with a rheumatologist or endocrinologist.",
             "Begin a medically supervised exercise program focusing on strength and balance.",
             "Strictly implement fall-prevention strategies (grab bars, non-slip mats, proper footwear).",
@@ -67,8 +77,8 @@ CLINICAL_DATA: Dict[str, Dict[str, List]] = {
             "Review all current medications for bone-density side effects (steroids, PPIs, diuretics).",
             "Consider physical therapy and occupational therapy for daily safety.",
             "Discuss FRAX score and 10-year fracture probability with your physician.",
-        ],
-        "medications": [
+        ),
+        "medications": (
             "Bisphosphonates: Alendronate 70 mg weekly  OR  Risedronate 35 mg weekly",
             "Calcium: 1200-1500 mg/day (split doses for better absorption)",
             "Vitamin D3: 1000-2000 IU/day",
@@ -76,13 +86,31 @@ CLINICAL_DATA: Dict[str, Dict[str, List]] = {
             "Teriparatide (Forteo): daily injection for severe cases (physician prescribed)",
             "Raloxifene (SERM): for post-menopausal women  -  discuss with doctor",
             "Regular follow-up every 6 months until bone density stabilises.",
-        ],
+        ),
         "t_score_range": (-4.0, -2.5),
         "bmd_range": (0.40, 0.70),
         "fracture_risk": "> 20% (High)",
     },
 }
 
+# Frozen once at import: callers get shared read-only views, never copies
+CLINICAL_DATA: Mapping[str, Mapping[str, object]] = MappingProxyType(
+    {k: MappingProxyType(v) for k, v in _CLINICAL_DATA.items()}
+)
+
+# (lo, hi - lo) per class, so each build_* draw is a single C-level random()
+_T_SCORE_SPAN: Dict[str, Tuple[float, float]] = {
+    k: (v["t_score_range"][0], v["t_score_range"][1] - v["t_score_range"][0])
+    for k, v in CLINICAL_DATA.items()
+}
+_BMD_SPAN: Dict[str, Tuple[float, float]] = {
+    k: (v["bmd_range"][0], v["bmd_range"][1] - v["bmd_range"][0])
+    for k, v in CLINICAL_DATA.items()
+}
+
+# Serialised once as well — the blocks never change between requests
+_CLINICAL_JSON: Dict[str, bytes] = {k: orjson.dumps(dict(v)) for k, v in CLINICAL_DATA.items()}
+
 
 def normalise_label(raw_prediction) -> str:
     """Convert integer index or string label to clean class name.
@@ -97,39 +125,82 @@ def normalise_label(raw_prediction) -> str:
     if isinstance(native, (int, float)):
         return CLASS_LABEL_MAP.get(int(native), "Normal")
     label = str(native).strip()
-    # Handle variations like 'osteoporosis', 'OSTEOPENIA', etc.
-    for key in CLASS_LABEL_MAP.values():
-        if key.lower() == label.lower():
-            return key
-    return label  # return as-is if unrecognised
-
+    # Handle variations like 'osteoporosis', 'OSTEOPENIA', etc.;
+    # return as-is if unrecognised
+    return LOWER_LABEL_MAP.get(label.lower(), label)
 
-def get_clinical_data(label: str) -> Dict:
-    """Return the clinical knowledge block for a given label."""
-    return CLINICAL_DATA.get(label, CLINICAL_DATA["Normal"])
 
+def get_clinical_data(label: str) -> Mapping:
+    """Return the read-only clinical knowledge block for a given label."""
+    return CLINICAL_DATA.get(label) or CLINICAL_DATA["Normal"]
 
-def simulate_prediction() -> Tuple[str, float]:
-    """
-    Deterministic-ish simulation for file-based endpoints until a real
-    image/PDF model is integrated.
 
-    Returns (label, confidence).
-    """
-    labels = ["Normal", "Osteopenia", "Osteoporosis"]
-    weights = [0.35, 0.40, 0.25]  # realistic population distribution
-    label = random.choices(labels, weights=weights, k=1)[0]
-    confidence = round(random.uniform(0.72, 0.96), 4)
-    return label, confidence
+def get_clinical_data_json(label: str) -> bytes | None:
+    """Return the clinical knowledge block for a class as JSON bytes (None if unknown)."""
+    return _CLINICAL_JSON.get(label)
 
 
 def build_t_score(label: str) -> float:
-    """Generate a realistic T-score within the expected range for the class."""
-    lo, hi = CLINICAL_DATA[label]["t_score_range"]
-    return round(random.uniform(lo, hi), 2)
+    """
+    Generate a realistic T-score within the expected range for the class.
+    Unrounded — the response builder / schema rounds every field exactly once.
+    """
+    lo, span = _T_SCORE_SPAN[label]
+    return lo + span * _random()
 
 
 def build_bmd(label: str) -> float:
-    lo, hi = CLINICAL_DATA[label]["bmd_range"]
-    return round(random.uniform(lo, hi), 3)
-
+    lo, span = _BMD_SPAN[label]
+    return lo + span * _random()
+
+
+def build_prediction_payload(
+    label: str,
+    confidence: float,
+    t_score: float | None,
+    bmd: float | None,
+    evidence_source: str | None = None,
+    extracted_data: Dict[str, str] | None = None,
+) -> PredictionResponseDict:
+    """
+    Assemble the prediction response as a plain dict, applying the same
+    rounding as PredictionResponse's validators, for routes that return an
+    ORJSONResponse instead of a pydantic model.
+    """
+    clinical = get_clinical_data(label)
+    return {
+        "prediction":      label,
+        "confidence":      round(confidence, 4),
+        "t_score":         round(t_score, 2) if t_score is not None else None,
+        "bmd":             round(bmd, 3) if bmd is not None else None,
+        "fracture_risk":   clinical["fracture_risk"],
+        "suggestions":     clinical["suggestions"],
+        "medications":     clinical["medications"],
+        "evidence_source": evidence_source,
+        "extracted_data":  extracted_data,
+    }
+
+
+# ─── Upload helpers ──────────────────────────────────────────────────────────
+
+def check_upload_size(n_bytes: int, max_mb: int) -> None:
+    """Raise HTTP 413 if `n_bytes` exceeds `max_mb` megabytes."""
+    if n_bytes > max_mb * 1024 * 1024:
+        raise HTTPException(
+            status_code=413,
+            detail=f"File too large (> {max_mb} MB). Maximum allowed: {max_mb} MB.",
+        )
+
+
+async def read_upload_limited(file: UploadFile, max_mb: int) -> bytes:
+    """
+    Stream an upload into memory in 1 MB chunks, aborting with HTTP 413 as
+    soon as the running total exceeds `max_mb`.  Starlette's multipart parser
+    has already spooled the whole upload to its temp file by now; this only
+    bounds the in-memory copy, to at most max_mb + 1 MB.
+    """
+    buf = bytearray()
+    while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+        buf.extend(chunk)
+        check_upload_size(len(buf), max_mb)
+    return bytes(buf)
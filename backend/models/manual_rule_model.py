@@ -24,28 +24,76 @@ Returns: (label: str, confidence: float, t_score: float, bmd: float)
 
 import math
 import random
+from bisect import bisect_right
+from functools import lru_cache
 from typing import Tuple
 
+import numpy as np
+
 # ── Scoring weights ─────────────────────────────────────────────────────────
 # Each factor contributes to a cumulative RISK SCORE (higher = worse).
 # Max theoretical score ≈ 27.
 
+# Piecewise-constant factor scores as (upper bounds, values) tables: the
+# score is values[bisect_right(bounds, x)] — one binary search instead of
+# an if-ladder.
+_AGE_BREAKS = (40.0, 50.0, 60.0, 70.0)
+_AGE_VALUES = (0.0, 1.0, 2.5, 4.5, 6.0)
+
+_BMI_BREAKS = (17.5, 18.5, 22.0, 30.0)
+_BMI_VALUES = (3.0, 2.0, 1.0, 0.0, 0.5)   # obesity slightly protective but other risks
+
+
 def _age_score(age: float) -> float:
     """Age is the single strongest predictor."""
-    if age < 40:   return 0.0
-    if age < 50:   return 1.0
-    if age < 60:   return 2.5
-    if age < 70:   return 4.5
-    return 6.0
+    return _AGE_VALUES[bisect_right(_AGE_BREAKS, age)]
 
 
 def _bmi_score(bmi: float) -> float:
     """Low BMI (<18.5) is a significant risk; obesity mildly protective."""
-    if bmi < 17.5:  return 3.0
-    if bmi < 18.5:  return 2.0
-    if bmi < 22.0:  return 1.0
-    if bmi < 30.0:  return 0.0
-    return 0.5   # obesity slightly protective but other risks
+    return _BMI_VALUES[bisect_right(_BMI_BREAKS, bmi)]
+
+
+# Calibrated score → label thresholds:  <6 Normal | 6-13 Osteopenia | >13 Osteoporosis
+LOW_THRESH  = 6.0
+HIGH_THRESH = 13.0
+_MID_THRESH  = (LOW_THRESH + HIGH_THRESH) / 2
+_HALF_SPAN   = (HIGH_THRESH - LOW_THRESH) / 2
+_N_FEATURES  = 14
+_LABELS      = ("Normal", "Osteopenia", "Osteoporosis")
+
+
+def _label_confidence(risk: float) -> Tuple[str, float]:
+    """Map a risk score to (label, confidence rounded to 4 dp)."""
+    if risk < LOW_THRESH:
+        label = "Normal"
+        # confidence: 0.72 at threshold → 0.97 at 0
+        t = 1.0 - (risk / LOW_THRESH)           # 0..1
+        confidence = 0.72 + 0.25 * t
+    elif risk <= HIGH_THRESH:
+        label = "Osteopenia"
+        # confidence peaks near mid-range, lower near thresholds
+        dist_from_mid = abs(risk - _MID_THRESH) / _HALF_SPAN
+        confidence = 0.75 + 0.15 * (1.0 - dist_from_mid)
+    else:
+        label = "Osteoporosis"
+        t = min((risk - HIGH_THRESH) / 8.0, 1.0)  # 0..1
+        confidence = 0.74 + 0.24 * t
+
+    # Clamp confidence
+    return label, round(max(0.70, min(0.99, confidence)), 4)
+
+
+# Every weight is a multiple of 0.1, so the reachable risk scores are the
+# tenths from 0 to the maximum (27.5); tabulate (label, confidence) for each
+# once and index by round(risk * 10) on the hot path.
+_MAX_RISK = (
+    _AGE_VALUES[-1] + max(_BMI_VALUES)
+    + 1.5 + 2.5 + 1.5 + 1.5 + 1.5 + 1.5 + 1.0 + 2.0 + 3.0 + 2.5
+)
+_RISK_LUT = tuple(_label_confidence(r10 / 10) for r10 in range(round(_MAX_RISK * 10) + 1))
+_CONF_LUT = np.array([c for _, c in _RISK_LUT])
+_LABEL_IDX_LUT = np.array([_LABELS.index(label) for label, _ in _RISK_LUT])
 
 
 def _derive_bmi(weight: float, height: float) -> float:
@@ -58,16 +106,29 @@ def score_features(features: list) -> Tuple[str, float, float, float]:
     """
     Compute a clinical risk score from the 14 feature vector and return
     (label, confidence, t_score, bmd).
+
+    The result depends only on the feature values (the jitter is derived
+    from them, not drawn), so repeat inputs are answered from a cache.
+    Confidence comes pre-rounded from the lookup table; t_score and bmd are
+    left unrounded for the caller's single rounding pass.
     """
-    # Pad with defaults if fewer features supplied
-    f = list(features) + [0] * 14
-    f = f[:14]
+    return _score_features_cached(tuple(features[:_N_FEATURES]))
+
+
+@lru_cache(maxsize=2048)
+def _score_features_cached(features: tuple) -> Tuple[str, float, float, float]:
+    # Already truncated by score_features; pad short inputs with defaults
+    f = features
+    if len(f) < _N_FEATURES:
+        f = [*f, *(0,) * (_N_FEATURES - len(f))]
 
     age        = float(f[0])
     gender     = int(f[1])        # 0=Female, 1=Male
     weight     = float(f[2])
     height     = float(f[3])
-    bmi        = float(f[4]) if float(f[4]) > 5 else _derive_bmi(weight, height)
+    bmi        = float(f[4])
+    if bmi <= 5:
+        bmi = _derive_bmi(weight, height)
     ca_intake  = int(f[5])        # 0=Low, 1=Normal, 2=High
     vit_d      = int(f[6])        # 0=Deficient, 1=Sufficient
     activity   = int(f[7])        # 0=Sedentary, 1=Moderate, 2=Active
@@ -110,41 +171,82 @@ def score_features(features: list) -> Tuple[str, float, float, float]:
     if steroid == 1:         risk += 2.5
 
     # ── Map score → label with sigmoid-like confidence ──────────────────
-    # Calibrated thresholds:  <6 Normal | 6-13 Osteopenia | >13 Osteoporosis
-    LOW_THRESH  = 6.0
-    HIGH_THRESH = 13.0
-
-    if risk < LOW_THRESH:
-        label = "Normal"
-        # confidence: 0.72 at threshold → 0.97 at 0
-        t = 1.0 - (risk / LOW_THRESH)           # 0..1
-        confidence = 0.72 + 0.25 * t
-    elif risk <= HIGH_THRESH:
-        label = "Osteopenia"
-        # confidence peaks near mid-range, lower near thresholds
-        mid = (LOW_THRESH + HIGH_THRESH) / 2
-        dist_from_mid = abs(risk - mid) / ((HIGH_THRESH - LOW_THRESH) / 2)
-        confidence = 0.75 + 0.15 * (1.0 - dist_from_mid)
-    else:
-        label = "Osteoporosis"
-        t = min((risk - HIGH_THRESH) / 8.0, 1.0)  # 0..1
-        confidence = 0.74 + 0.24 * t
-
-    # Clamp confidence
-    confidence = max(0.70, min(0.99, confidence))
+    label, confidence = _RISK_LUT[round(risk * 10)]
 
     # ── Derive T-score and BMD from risk score (clinically plausible) ───
     # T-score: Normal ≥ -1.0 | Osteopenia -1.0 to -2.5 | Osteoporosis ≤ -2.5
     # Map risk 0..27 → T-score 0.5 .. -4.5
     t_score_raw = 0.5 - (risk / 27.0) * 5.0
     # Add small deterministic jitter from features (reproducible)
-    jitter = ((sum(f) * 7.3) % 1.0 - 0.5) * 0.3
-    t_score = round(t_score_raw + jitter, 2)
+    f_sum = sum(f)
+    jitter = ((f_sum * 7.3) % 1.0 - 0.5) * 0.3
+    t_score = t_score_raw + jitter
 
     # BMD: roughly 1.0 for Normal → 0.5 for severe Osteoporosis
     # Normal BMD ~0.9-1.1, Osteopenia 0.7-0.9, Osteoporosis 0.4-0.7
     bmd_raw = 1.05 - (risk / 27.0) * 0.65
-    bmd_jitter = ((sum(f) * 3.7) % 1.0 - 0.5) * 0.05
-    bmd = round(max(0.4, min(1.2, bmd_raw + bmd_jitter)), 3)
+    bmd_jitter = ((f_sum * 3.7) % 1.0 - 0.5) * 0.05
+    bmd = max(0.4, min(1.2, bmd_raw + bmd_jitter))
+
+    return label, confidence, t_score, bmd
 
-    return label, round(confidence, 4), t_score, bmd
+
+def score_features_batch(
+    X,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Vectorised score_features() over N patients.
+
+    X: (N, k) array-like of feature rows in the same 14-value order
+       (shorter rows are zero-padded, longer ones truncated, as in the
+       scalar version).  A single 1-D row is treated as N=1.
+
+    Returns (labels, confidences, t_scores, bmds), each of shape (N,).
+    As in score_features, t_scores and bmds are unrounded; the caller
+    rounds once.
+    Use this for cohort / CSV scoring; the per-request route keeps calling
+    score_features(), which is cheaper than numpy for a single row.
+    """
+    X = np.atleast_2d(np.asarray(X, dtype=np.float64))
+    n, k = X.shape
+    if k < _N_FEATURES:
+        X = np.hstack([X, np.zeros((n, _N_FEATURES - k))])
+    else:
+        X = X[:, :_N_FEATURES]
+
+    # Integer-coded columns are truncated toward zero like int() in the scalar path
+    codes = np.trunc(X)
+
+    age, weight, height, bmi = X[:, 0], X[:, 2], X[:, 3], X[:, 4]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        derived = np.where(height <= 0, 22.0, weight / (height / 100) ** 2)
+    bmi = np.where(bmi <= 5, derived, bmi)
+
+    # Accumulated in the same order as score_features for identical sums
+    risk  = np.zeros(n)
+    risk += np.take(_AGE_VALUES, np.searchsorted(_AGE_BREAKS, age, side="right"))
+    risk += np.take(_BMI_VALUES, np.searchsorted(_BMI_BREAKS, bmi, side="right"))
+    risk += 1.5 * (codes[:, 1] == 0)                                   # female baseline
+    risk += 2.5 * (codes[:, 12] == 1)                                  # post-menopausal
+    risk += np.where(codes[:, 5] == 0, 1.5, np.where(codes[:, 5] == 1, 0.5, 0.0))
+    risk += 1.5 * (codes[:, 6] == 0)
+    risk += np.where(codes[:, 7] == 0, 1.5, np.where(codes[:, 7] == 1, 0.5, 0.0))
+    risk += 1.5 * (codes[:, 8] == 1)
+    risk += np.where(codes[:, 9] == 2, 1.0, np.where(codes[:, 9] == 1, 0.3, 0.0))
+    risk += 2.0 * (codes[:, 10] == 1)
+    risk += 3.0 * (codes[:, 11] == 1)
+    risk += 2.5 * (codes[:, 13] == 1)
+
+    # ── Map score → label / confidence via the same lookup table ─────────
+    r10 = np.rint(risk * 10).astype(np.intp)
+    label_idx = np.take(_LABEL_IDX_LUT, r10)
+    confidence = np.take(_CONF_LUT, r10)
+
+    # ── T-score / BMD with the same deterministic jitter ─────────────────
+    f_sum = np.cumsum(X, axis=1)[:, -1]      # sequential sum, like sum(f)
+    t_score = 0.5 - (risk / 27.0) * 5.0 + (np.mod(f_sum * 7.3, 1.0) - 0.5) * 0.3
+    bmd_raw = 1.05 - (risk / 27.0) * 0.65 + (np.mod(f_sum * 3.7, 1.0) - 0.5) * 0.05
+    bmd = np.clip(bmd_raw, 0.4, 1.2)
+
+    labels = np.take(np.array(_LABELS), label_idx)
+    return labels, confidence, t_score, bmd
@@ -4,7 +4,7 @@ report_nlp_model.py
 Full clinical-feature extraction from uploaded PDF / text reports.
 
 Pipeline:
-  1. PDF  -> pdfplumber extracts full text from every page.
+  1. PDF  -> PyMuPDF (pdfplumber fallback) extracts full text from every page.
   2. Text -> 14 clinical features are parsed with focused regex patterns.
   3. Features fed into score_features() (same model as Manual Predictor).
   4. If not enough features found, falls back to T-score / BMD / keyword path.
@@ -35,51 +35,190 @@ from __future__ import annotations
 import re
 import io
 import hashlib
-from typing import Optional, Tuple
+import threading
+from collections import OrderedDict
+from typing import BinaryIO, Optional, Tuple, Union
+
+import numpy as np
+
+# google-re2 matches in linear time (no backtracking on long OCR'd text with
+# the `.*` patterns below); the stdlib engine is used when it isn't installed
+# or rejects a pattern.
+try:
+    import re2 as _re_engine
+except ImportError:
+    _re_engine = re
 
 # Minimum number of clinical features to trust the manual-model path
 _MIN_FEATURES_FOR_MANUAL = 4
 
 # ─── Text extraction ──────────────────────────────────────────────────────────
+# `content` is either the raw bytes or a seekable binary file (the upload's
+# spooled temp file).  Hashing and the pdfplumber fallback stream from the
+# file; PyMuPDF (the primary extractor) and the raw-text path need the whole
+# document in memory and read it via _read_source().
+
+ReportSource = Union[bytes, BinaryIO]
+
+def _read_source(content: ReportSource) -> bytes:
+    """Whole report as bytes — a full copy when `content` is a file."""
+    if isinstance(content, bytes):
+        return content
+    content.seek(0)
+    return content.read()
+
+def _hash_source(h, content: ReportSource) -> None:
+    """Feed the report into hash object `h` without copying a file into memory."""
+    if isinstance(content, bytes):
+        h.update(content)
+        return
+    content.seek(0)
+    for chunk in iter(lambda: content.read(1 << 20), b""):
+        h.update(chunk)
+
+def _pdf_text_fitz(content: ReportSource) -> str:
+    try:
+        import fitz  # PyMuPDF
+        # fitz opens from a path or an in-memory stream; the spool has no
+        # usable path, so a file source is read into bytes here.
+        with fitz.open(stream=_read_source(content), filetype="pdf") as doc:
+            return "\n".join(page.get_text("text") for page in doc)
+    except Exception:
+        return ""
 
-def _pdf_text(content: bytes) -> str:
+def _pdf_text_pdfplumber(content: ReportSource) -> str:
     try:
         import pdfplumber
-        with pdfplumber.open(io.BytesIO(content)) as pdf:
-            pages = [p.extract_text() for p in pdf.pages if p.extract_text()]
-            return "\n".join(pages)
+        if isinstance(content, bytes):
+            content = io.BytesIO(content)
+        else:
+            content.seek(0)   # pdfminer reads the file object directly
+        with pdfplumber.open(content) as pdf:
+            parts = []
+            for page in pdf.pages:
+                t = page.extract_text()
+                # Drop the page's parsed chars/layout objects before the next
+                # one, so peak memory is one page rather than the whole file.
+                page.flush_cache()
+                if t:
+                    parts.append(t)
+            return "\n".join(parts)
     except Exception:
         return ""
 
+def _pdf_text(content: ReportSource) -> str:
+    # PyMuPDF is ~10x faster than pdfminer-based pdfplumber; pdfplumber is
+    # kept for PDFs where fitz yields nothing (missing / scrambled fonts).
+    t = _pdf_text_fitz(content)
+    if t.strip():
+        return t
+    return _pdf_text_pdfplumber(content)
+
+# Non-printable code points below U+0100 (other than \n, \t), for str.translate
+_NON_PRINTABLE_LATIN1 = {
+    i: None for i in range(256) if not (chr(i).isprintable() or chr(i) in "\n\t ")
+}
+
+def _printable(text: str) -> str:
+    """Keep printable characters plus newline, tab and space."""
+    # One C-level translate covers every control below U+0100; only text that
+    # still holds other non-ASCII characters needs the per-character check.
+    text = text.translate(_NON_PRINTABLE_LATIN1)
+    if text.isascii():
+        return text
+    return "".join(c for c in text if c.isprintable() or c in "\n\t ")
+
 def _raw_text(content: bytes) -> str:
     for enc in ("utf-8", "latin-1"):
         try:
             text = content.decode(enc, errors="ignore")
-            printable = "".join(c for c in text if c.isprintable() or c in "\n\t ")
+            printable = _printable(text)
             if len(printable.strip()) > 30:
                 return printable
         except Exception:
             continue
     return ""
 
-def extract_text(content: bytes, filename: str) -> str:
+def _has_pdf_magic(content: ReportSource) -> bool:
+    if isinstance(content, bytes):
+        return content[:5] == b"%PDF-"
+    content.seek(0)
+    return content.read(5) == b"%PDF-"
+
+def extract_text(content: ReportSource, filename: str) -> str:
+    # Sniff the %PDF- header too: uploads are often misnamed or extensionless
     fname = (filename or "").lower()
-    if fname.endswith(".pdf"):
+    if fname.endswith(".pdf") or _has_pdf_magic(content):
         t = _pdf_text(content)
         if t.strip():
             return t
-    return _raw_text(content)
+    return _raw_text(_read_source(content))
 
 # ─── Individual field extractors ─────────────────────────────────────────────
+# Every pattern is compiled once at import; the extractors below only call
+# .search() on prebuilt pattern objects (no per-request re._cache lookups).
+# analyse_report lower-cases the text once, so the patterns are written in
+# lower case and matched case-sensitively — no per-character case folding.
 
-def _rx(pattern: str, text: str, group: int = 1):
-    m = re.search(pattern, text, re.IGNORECASE)
+def _lc(pattern: str) -> re.Pattern:
+    try:
+        return _re_engine.compile(pattern)
+    except _re_engine.error:
+        return re.compile(pattern)
+
+_AGE_RE          = _lc(r"(?:age|aged)[:\s]+(\d{1,3})")
+_AGE_YRS_RE      = _lc(r"\b(\d{2,3})\s*(?:year|yr)s?[\s\-]?old")
+_FEMALE_RE       = _lc(r"\b(?:female|woman|mrs?\.?|she|her)\b")
+_MALE_RE         = _lc(r"\b(?:male|man|mr\.?|he|his)\b")
+_WEIGHT_RE       = _lc(r"(?:weight|wt)[:\s]+(\d{2,3}(?:\.\d)?)\s*kg")
+_WEIGHT_KG_RE    = _lc(r"\b(\d{2,3}(?:\.\d)?)\s*kgs?\b")
+_HEIGHT_RE       = _lc(r"(?:height|ht)[:\s]+(\d{2,3}(?:\.\d)?)\s*cm")
+_HEIGHT_CM_RE    = _lc(r"\b(1\d{2}(?:\.\d)?)\s*cm\b")
+_HEIGHT_M_RE     = _lc(r"\b(1\.\d{2})\s*m\b")
+_BMI_RE          = _lc(r"bmi[:\s=]+(\d{1,2}(?:\.\d{1,2})?)")
+_CALCIUM_RE      = _lc(r"(?:serum\s+)?calcium[:\s]+(\d{1,2}(?:\.\d)?)\s*(?:mg|mmol)")
+_CALCIUM_LOW_RE  = _lc(r"\blow\s+calcium\b|\bcalcium\s+deficien")
+_CALCIUM_NORM_RE = _lc(r"\bnormal\s+calcium\b|\bcalcium\s+normal\b")
+_CALCIUM_HIGH_RE = _lc(r"\bhigh\s+calcium\b|\bhypercalcaemi")
+_VITD_RE         = _lc(r"vitamin[\s-]?d(?:\s+level)?[:\s=]+(\d{1,3}(?:\.\d)?)\s*(?:ng|nmol)")
+_VITD_25OH_RE    = _lc(r"\b25[\s-]?oh[\s-]?(?:vitamin[\s-]?)?d[:\s=]+(\d{1,3}(?:\.\d)?)")
+_VITD_DEF_RE     = _lc(r"\bvitamin\s*d\s+deficien|\blow\s+vitamin\s*d\b")
+_VITD_SUFF_RE    = _lc(r"\bnormal\s+vitamin\s*d\b|\bvitamin\s*d\s+(?:normal|sufficient|adequate)\b")
+_SEDENTARY_RE    = _lc(r"\bsedentary\b|\binactive\b|\bno\s+(?:exercise|physical\s+activity)\b")
+_ACTIVE_RE       = _lc(r"\bvigorous\b|\bactively\s+exercis|\bphysically\s+active\b|\bregular\s+exercise\b")
+_MODERATE_RE     = _lc(r"\bmoderate\b|\bwalks?\b|\boccasional\s+exercise\b")
+_NON_SMOKER_RE   = _lc(r"\bnon[\s-]?smok|\bnever\s+smok|\bex[\s-]?smok|\bformer\s+smok\b|\bno\s+(?:smoking|tobacco)\b")
+_SMOKER_RE       = _lc(r"\bsmok(?:er|ing|es)\b|\bcurrent\s+smok\b|\bcigarette\b|\btobacco\b")
+_ALC_REGULAR_RE  = _lc(r"\bheavy\s+drink|\bregular\s+alcohol|\bexcessive\s+alcohol\b|\balcohol\s+abuse\b")
+_ALC_OCCAS_RE    = _lc(r"\bocca?s?ional\s+(?:drink|alcohol)\b|\bsocial\s+drink\b|\b1[\s-]2\s+drink")
+_ALC_NONE_RE     = _lc(r"\bnon[\s-]?drink|\bno\s+alcohol|\bteetotal\b|\bdoes\s+not\s+drink\b|\bnon[\s-]?alcoholic\b")
+_FHIST_POS_RE    = _lc(
+    r"family\s+history\s+(?:of\s+)?(?:osteoporosis|fracture)|"
+    r"mother.*(?:osteoporosis|fracture)|father.*(?:osteoporosis|fracture)|"
+    r"(?:osteoporosis|fracture).*(?:mother|father|parent|sibling)"
+)
+_FHIST_NEG_RE    = _lc(r"no\s+family\s+history|family\s+history[:\s]+(?:none|no|negative)")
+_PFRAC_POS_RE    = _lc(
+    r"previous\s+fracture|prior\s+fracture|history\s+of\s+fracture|"
+    r"past\s+fracture|fragility\s+fracture|sustained\s+a\s+fracture"
+)
+_PFRAC_NEG_RE    = _lc(r"no\s+(?:previous|prior|past)\s+fracture|fracture\s+history[:\s]+(?:none|no)")
+_MENO_POST_RE    = _lc(r"\bpost[\s-]?menopaus|\bmenopaus(?:al|e)\b")
+_MENO_PRE_RE     = _lc(r"\bpre[\s-]?menopaus\b|\bnot\s+(?:yet\s+)?menopausal\b")
+_STEROID_POS_RE  = _lc(
+    r"\bcorticosteroid|\bprednisone|\bprednisolone|\bdexamethasone|\bhydrocortisone|"
+    r"\blong[\s-]term\s+steroid|\boral\s+steroid"
+)
+_STEROID_NEG_RE  = _lc(r"\bno\s+steroid|\bsteroid[\s-]?free\b")
+
+def _rx(pattern: re.Pattern, text: str, group: int = 1):
+    m = pattern.search(text)
     return m.group(group).strip() if m else None
 
 def _age(text: str) -> Optional[Tuple[float, str]]:
-    raw = _rx(r"(?:age|aged)[:\s]+(\d{1,3})", text)
+    raw = _rx(_AGE_RE, text)
     if not raw:
-        raw = _rx(r"\b(\d{2,3})\s*(?:year|yr)s?[\s\-]?old", text)
+        raw = _rx(_AGE_YRS_RE, text)
     if raw:
         v = float(raw)
         if 10 <= v <= 110:
@@ -87,16 +226,16 @@ def _age(text: str) -> Optional[Tuple[float, str]]:
     return None
 
 def _gender(text: str) -> Optional[Tuple[float, str]]:
-    if re.search(r"\b(?:female|woman|mrs?\.?|she|her)\b", text, re.IGNORECASE):
+    if _FEMALE_RE.search(text):
         return 0.0, "Female"
-    if re.search(r"\b(?:male|man|mr\.?|he|his)\b", text, re.IGNORECASE):
+    if _MALE_RE.search(text):
         return 1.0, "Male"
     return None
 
 def _weight(text: str) -> Optional[Tuple[float, str]]:
-    raw = _rx(r"(?:weight|wt)[:\s]+(\d{2,3}(?:\.\d)?)\s*kg", text)
+    raw = _rx(_WEIGHT_RE, text)
     if not raw:
-        raw = _rx(r"\b(\d{2,3}(?:\.\d)?)\s*kgs?\b", text)
+        raw = _rx(_WEIGHT_KG_RE, text)
     if raw:
         v = float(raw)
         if 20 <= v <= 300:
@@ -104,27 +243,31 @@ def _weight(text: str) -> Optional[Tuple[float, str]]:
     return None
 
 def _height(text: str) -> Optional[Tuple[float, str]]:
-    raw = _rx(r"(?:height|ht)[:\s]+(\d{2,3}(?:\.\d)?)\s*cm", text)
+    raw = _rx(_HEIGHT_RE, text)
     if not raw:
-        raw = _rx(r"\b(1\d{2}(?:\.\d)?)\s*cm\b", text)
+        raw = _rx(_HEIGHT_CM_RE, text)
     if raw:
         v = float(raw)
         if 100 <= v <= 220:
             return v, f"{v:.0f} cm"
     # Try metres: "1.65 m"
-    raw2 = _rx(r"\b(1\.\d{2})\s*m\b", text)
+    raw2 = _rx(_HEIGHT_M_RE, text)
     if raw2:
         v = float(raw2) * 100
         if 100 <= v <= 220:
             return v, f"{v:.0f} cm"
     return None
 
-def _bmi(text: str, weight: Optional[float], height: Optional[float]) -> Optional[Tuple[float, str]]:
-    raw = _rx(r"bmi[:\s=]+(\d{1,2}(?:\.\d{1,2})?)", text)
+def _bmi(text: str) -> Optional[Tuple[float, str]]:
+    raw = _rx(_BMI_RE, text)
     if raw:
         v = float(raw)
         if 10 <= v <= 60:
             return v, f"{v:.1f} kg/m2"
+    return None
+
+def _bmi_from(weight: Optional[float], height: Optional[float]) -> Optional[Tuple[float, str]]:
+    """BMI calculated from extracted weight/height when the report doesn't state it."""
     if weight and height:
         v = round(weight / ((height / 100) ** 2), 1)
         if 10 <= v <= 60:
@@ -132,7 +275,7 @@ def _bmi(text: str, weight: Optional[float], height: Optional[float]) -> Optiona
     return None
 
 def _calcium(text: str) -> Optional[Tuple[float, str]]:
-    raw = _rx(r"(?:serum\s+)?calcium[:\s]+(\d{1,2}(?:\.\d)?)\s*(?:mg|mmol)", text)
+    raw = _rx(_CALCIUM_RE, text)
     if raw:
         v = float(raw)
         if v < 8.5:
@@ -140,112 +283,128 @@ def _calcium(text: str) -> Optional[Tuple[float, str]]:
         if v > 10.5:
             return 2.0, f"High ({v:.1f} mg/dL)"
         return 1.0, f"Normal ({v:.1f} mg/dL)"
-    if re.search(r"\blow\s+calcium\b|\bcalcium\s+deficien", text, re.IGNORECASE):
+    if _CALCIUM_LOW_RE.search(text):
         return 0.0, "Low (stated)"
-    if re.search(r"\bnormal\s+calcium\b|\bcalcium\s+normal\b", text, re.IGNORECASE):
+    if _CALCIUM_NORM_RE.search(text):
         return 1.0, "Normal (stated)"
-    if re.search(r"\bhigh\s+calcium\b|\bhypercalcaemi", text, re.IGNORECASE):
+    if _CALCIUM_HIGH_RE.search(text):
         return 2.0, "High (stated)"
     return None
 
 def _vitamin_d(text: str) -> Optional[Tuple[float, str]]:
-    raw = _rx(r"vitamin[\s-]?d(?:\s+level)?[:\s=]+(\d{1,3}(?:\.\d)?)\s*(?:ng|nmol)", text)
+    raw = _rx(_VITD_RE, text)
     if not raw:
-        raw = _rx(r"\b25[\s-]?oh[\s-]?(?:vitamin[\s-]?)?d[:\s=]+(\d{1,3}(?:\.\d)?)", text)
+        raw = _rx(_VITD_25OH_RE, text)
     if raw:
         v = float(raw)
         threshold = 50 if v > 30 else 20
         if v < threshold:
             return 0.0, f"Deficient ({v:.0f})"
         return 1.0, f"Sufficient ({v:.0f})"
-    if re.search(r"\bvitamin\s*d\s+deficien|\blow\s+vitamin\s*d\b", text, re.IGNORECASE):
+    if _VITD_DEF_RE.search(text):
         return 0.0, "Deficient (stated)"
-    if re.search(r"\bnormal\s+vitamin\s*d\b|\bvitamin\s*d\s+(?:normal|sufficient|adequate)\b", text, re.IGNORECASE):
+    if _VITD_SUFF_RE.search(text):
         return 1.0, "Sufficient (stated)"
     return None
 
 def _activity(text: str) -> Optional[Tuple[float, str]]:
-    if re.search(r"\bsedentary\b|\binactive\b|\bno\s+(?:exercise|physical\s+activity)\b", text, re.IGNORECASE):
+    if _SEDENTARY_RE.search(text):
         return 0.0, "Sedentary"
-    if re.search(r"\bvigorous\b|\bactively\s+exercis|\bphysically\s+active\b|\bregular\s+exercise\b", text, re.IGNORECASE):
+    if _ACTIVE_RE.search(text):
         return 2.0, "Active"
-    if re.search(r"\bmoderate\b|\bwalks?\b|\boccasional\s+exercise\b", text, re.IGNORECASE):
+    if _MODERATE_RE.search(text):
         return 1.0, "Moderate"
     return None
 
 def _smoking(text: str) -> Optional[Tuple[float, str]]:
-    if re.search(r"\bnon[\s-]?smok|\bnever\s+smok|\bex[\s-]?smok|\bformer\s+smok\b|\bno\s+(?:smoking|tobacco)\b", text, re.IGNORECASE):
+    if _NON_SMOKER_RE.search(text):
         return 0.0, "Non-smoker"
-    if re.search(r"\bsmok(?:er|ing|es)\b|\bcurrent\s+smok\b|\bcigarette\b|\btobacco\b", text, re.IGNORECASE):
+    if _SMOKER_RE.search(text):
         return 1.0, "Smoker"
     return None
 
 def _alcohol(text: str) -> Optional[Tuple[float, str]]:
-    if re.search(r"\bheavy\s+drink|\bregular\s+alcohol|\bexcessive\s+alcohol\b|\balcohol\s+abuse\b", text, re.IGNORECASE):
+    if _ALC_REGULAR_RE.search(text):
         return 2.0, "Regular"
-    if re.search(r"\bocca?s?ional\s+(?:drink|alcohol)\b|\bsocial\s+drink\b|\b1[\s-]2\s+drink", text, re.IGNORECASE):
+    if _ALC_OCCAS_RE.search(text):
         return 1.0, "Occasional"
-    if re.search(r"\bnon[\s-]?drink|\bno\s+alcohol|\bteetotal\b|\bdoes\s+not\s+drink\b|\bnon[\s-]?alcoholic\b", text, re.IGNORECASE):
+    if _ALC_NONE_RE.search(text):
         return 0.0, "None"
     return None
 
 def _family_history(text: str) -> Optional[Tuple[float, str]]:
-    if re.search(
-        r"family\s+history\s+(?:of\s+)?(?:osteoporosis|fracture)|"
-        r"mother.*(?:osteoporosis|fracture)|father.*(?:osteoporosis|fracture)|"
-        r"(?:osteoporosis|fracture).*(?:mother|father|parent|sibling)",
-        text, re.IGNORECASE
-    ):
+    if _FHIST_POS_RE.search(text):
         return 1.0, "Positive"
-    if re.search(r"no\s+family\s+history|family\s+history[:\s]+(?:none|no|negative)", text, re.IGNORECASE):
+    if _FHIST_NEG_RE.search(text):
         return 0.0, "None"
     return None
 
 def _prev_fracture(text: str) -> Optional[Tuple[float, str]]:
-    if re.search(
-        r"previous\s+fracture|prior\s+fracture|history\s+of\s+fracture|"
-        r"past\s+fracture|fragility\s+fracture|sustained\s+a\s+fracture",
-        text, re.IGNORECASE
-    ):
+    if _PFRAC_POS_RE.search(text):
         return 1.0, "Yes"
-    if re.search(r"no\s+(?:previous|prior|past)\s+fracture|fracture\s+history[:\s]+(?:none|no)", text, re.IGNORECASE):
+    if _PFRAC_NEG_RE.search(text):
         return 0.0, "None"
     return None
 
 def _menopause(text: str) -> Optional[Tuple[float, str]]:
-    if re.search(r"\bpost[\s-]?menopaus|\bmenopaus(?:al|e)\b", text, re.IGNORECASE):
+    if _MENO_POST_RE.search(text):
         return 1.0, "Yes"
-    if re.search(r"\bpre[\s-]?menopaus\b|\bnot\s+(?:yet\s+)?menopausal\b", text, re.IGNORECASE):
+    if _MENO_PRE_RE.search(text):
         return 0.0, "No"
     return None
 
 def _steroids(text: str) -> Optional[Tuple[float, str]]:
-    if re.search(
-        r"\bcorticosteroid|\bprednisone|\bprednisolone|\bdexamethasone|\bhydrocortisone|"
-        r"\blong[\s-]term\s+steroid|\boral\s+steroid",
-        text, re.IGNORECASE
-    ):
+    if _STEROID_POS_RE.search(text):
         return 1.0, "Yes"
-    if re.search(r"\bno\s+steroid|\bsteroid[\s-]?free\b", text, re.IGNORECASE):
+    if _STEROID_NEG_RE.search(text):
         return 0.0, "No"
     return None
 
+# (extracted_data key, extractor) in feature order.  BMI is the one field
+# with a dependency: when not stated, analyse_report derives it from the
+# weight / height results via _bmi_from().
+_FIELD_EXTRACTORS = (
+    ("Age",               _age),
+    ("Gender",            _gender),
+    ("Weight",            _weight),
+    ("Height",            _height),
+    ("BMI",               _bmi),
+    ("Calcium Intake",    _calcium),
+    ("Vitamin D",         _vitamin_d),
+    ("Physical Activity", _activity),
+    ("Smoking",           _smoking),
+    ("Alcohol",           _alcohol),
+    ("Family History",    _family_history),
+    ("Previous Fracture", _prev_fracture),
+    ("Menopause",         _menopause),
+    ("Steroid Use",       _steroids),
+)
+_AGE_IDX, _GENDER_IDX, _WEIGHT_IDX, _HEIGHT_IDX, _BMI_IDX = 0, 1, 2, 3, 4
+_MENO_IDX = 12
+
+# Manual-model defaults for fields missing from the report (PATH A); None
+# marks the two computed from other fields (BMI, menopause).
+_FIELD_DEFAULTS = (55.0, 0.0, 65.0, 163.0, None, 1.0, 1.0, 1.0,
+                   0.0, 0.0, 0.0, 0.0, None, 0.0)
+
 # ─── T-score / BMD direct extraction ─────────────────────────────────────────
 
-_T_SCORE_RE = re.compile(r"t[\s\-]?score[\s:=of]{0,6}([+-]?\d+\.?\d*)", re.IGNORECASE)
-_Z_SCORE_RE = re.compile(r"z[\s\-]?score[\s:=of]{0,6}([+-]?\d+\.?\d*)", re.IGNORECASE)
-_BMD_RE     = re.compile(r"(?:bmd|bone mineral density)[\s:=]{0,6}([0-9]\.[0-9]{1,4})", re.IGNORECASE)
+_T_SCORE_RE = _lc(r"t[\s\-]?score[\s:=of]{0,6}([+-]?\d+\.?\d*)")
+_Z_SCORE_RE = _lc(r"z[\s\-]?score[\s:=of]{0,6}([+-]?\d+\.?\d*)")
+_BMD_RE     = _lc(r"(?:bmd|bone mineral density)[\s:=]{0,6}([0-9]\.[0-9]{1,4})")
 
+# (literal, pattern, label, risk): every match must contain the literal, so a
+# C-level substring test rules most keywords out before the regex runs.
 _DIAG_KEYWORDS = [
-    (re.compile(r"\bosteoporosis\b",        re.IGNORECASE), "Osteoporosis", +3.0),
-    (re.compile(r"\bosteopenia\b",          re.IGNORECASE), "Osteopenia",   +0.0),
-    (re.compile(r"\bnormal bone density\b", re.IGNORECASE), "Normal",       +0.0),
-    (re.compile(r"\bnormal\b",              re.IGNORECASE), "Normal",       +0.0),
-    (re.compile(r"\blow bone(?:\s+mineral)?\s+density\b", re.IGNORECASE), "Osteopenia", +0.0),
-    (re.compile(r"\bfracture\b",            re.IGNORECASE), None,           +1.5),
-    (re.compile(r"\bbone loss\b",           re.IGNORECASE), None,           +1.0),
-    (re.compile(r"\bpost.?menopaus",        re.IGNORECASE), None,           +1.2),
-    (re.compile(r"\bsteroid\b",             re.IGNORECASE), None,           +0.8),
+    ("osteoporosis",        _lc(r"\bosteoporosis\b"),                      "Osteoporosis", +3.0),
+    ("osteopenia",          _lc(r"\bosteopenia\b"),                        "Osteopenia",   +0.0),
+    ("normal bone density", _lc(r"\bnormal bone density\b"),               "Normal",       +0.0),
+    ("normal",              _lc(r"\bnormal\b"),                            "Normal",       +0.0),
+    ("density",             _lc(r"\blow bone(?:\s+mineral)?\s+density\b"), "Osteopenia",   +0.0),
+    ("fracture",            _lc(r"\bfracture\b"),                          None,           +1.5),
+    ("bone loss",           _lc(r"\bbone loss\b"),                         None,           +1.0),
+    ("menopaus",            _lc(r"\bpost.?menopaus"),                      None,           +1.2),
+    ("steroid",             _lc(r"\bsteroid\b"),                           None,           +0.8),
 ]
 
 def _label_from_t(t: float) -> Tuple[str, float]:
@@ -261,9 +420,13 @@ def _t_from_bmd(bmd: float) -> float:
 def _bmd_from_t(t: float) -> float:
     return round(0.95 + t * 0.12, 3)
 
-def _hash_fallback(content: bytes, filename: str = "") -> Tuple[str, float, float, float]:
-    digest   = hashlib.sha256(content + filename.encode()).hexdigest()
-    hash_val = int(digest[:8], 16) / 0xFFFFFFFF
+def _hash_fallback(content: ReportSource, filename: str = "") -> Tuple[str, float, float, float]:
+    # sha256(content + filename), fed incrementally instead of concatenating
+    h = hashlib.sha256()
+    _hash_source(h, content)
+    h.update(filename.encode())
+    digest   = h.digest()
+    hash_val = int.from_bytes(digest[:4], "big") / 0xFFFFFFFF
     if hash_val < 0.40:
         label, t, b = "Normal",       round(-0.3 - hash_val * 1.5, 2), round(0.92 + hash_val * 0.1, 3)
         cb = 0.71
@@ -273,7 +436,7 @@ def _hash_fallback(content: bytes, filename: str = "") -> Tuple[str, float, floa
     else:
         label, t, b = "Osteoporosis", round(-2.6 - hash_val * 1.5, 2), round(0.65 - hash_val * 0.2, 3)
         cb = 0.69
-    jitter = int(digest[8:12], 16) / 0xFFFF * 0.12
+    jitter = int.from_bytes(digest[4:6], "big") / 0xFFFF * 0.12
     return label, round(min(0.93, cb + jitter), 4), max(-5.5, t), max(0.40, b)
 
 # ─── Tabular-model feature builder ────────────────────────────────────────────
@@ -282,10 +445,11 @@ def build_tabular_features_16(
     age_r, gender_r, weight_r, height_r, bmi_r,
     calcium_r, vitd_r, act_r, smok_r, alc_r,
     fhist_r, pfrac_r, meno_r, ster_r,
-) -> list:
+) -> np.ndarray:
     """
-    Convert extracted (value, display) tuples into the 16-element feature
-    vector expected by tabular_ensemble_model.pkl + scaler.pkl.
+    Convert extracted (value, display) tuples into the (1, 16) float64 row
+    expected by tabular_ensemble_model.pkl + scaler.pkl, filled in place so
+    it can go straight to scaler.transform() without a list→array pass.
 
     Feature order (must match feature_columns.pkl):
       0  Age
@@ -339,7 +503,8 @@ def build_tabular_features_16(
 
     prior_fractures = pfrac_r[0] if pfrac_r is not None else 0.0
 
-    return [
+    x = np.empty((1, 16), dtype=np.float64)
+    x[0] = (
         age,             # 0  Age
         gender,          # 1  Gender_Male
         postmeno,        # 2  Hormonal Changes_Postmenopausal
@@ -356,25 +521,61 @@ def build_tabular_features_16(
         0.0,             # 13 Medical Conditions_Unknown
         meds_unknown,    # 14 Medications_Unknown
         prior_fractures, # 15 Prior Fractures_Yes
-    ]
+    )
+    return x
 
 
 # ─── Main entry point ────────────────────────────────────────────────────────
 
-def analyse_report(
-    content: bytes,
-    filename: str = "",
-) -> Tuple[str, float, Optional[float], Optional[float], str, dict, Optional[list]]:
+ReportResult = Tuple[str, float, Optional[float], Optional[float], str, dict, Optional[np.ndarray]]
+
+# Analysis is deterministic in (filename, content), so re-uploads and client
+# retries of the same file are answered from a small LRU keyed by SHA-256.
+_REPORT_CACHE_SIZE = 256
+_report_cache: "OrderedDict[bytes, ReportResult]" = OrderedDict()
+_report_cache_lock = threading.Lock()
+
+def _report_key(content: ReportSource, filename: str) -> bytes:
+    h = hashlib.sha256(filename.encode())
+    h.update(b"\0")
+    _hash_source(h, content)
+    return h.digest()
+
+def _copy_result(result: ReportResult) -> ReportResult:
+    # Callers own the dict and standardise the feature row in place
+    *head, extracted_data, raw_features_16 = result
+    return (*head, dict(extracted_data),
+            None if raw_features_16 is None else raw_features_16.copy())
+
+def analyse_report(content: ReportSource, filename: str = "") -> ReportResult:
     """
     Extract all clinical data from a report and return a rule-based prediction
     alongside the 16-element feature vector for the tabular ensemble model.
+    `content` may be the file bytes or a seekable binary file object.
 
     Returns:
         (label, confidence, t_score, bmd, evidence_source, extracted_data, raw_features_16)
-        raw_features_16 – list[float] of 16 values ready for scaler.transform()
+        raw_features_16 – (1, 16) float64 array ready for scaler.transform()
                           None only when no text could be read at all.
     """
-    text = extract_text(content, filename)
+    key = _report_key(content, filename)
+    with _report_cache_lock:
+        cached = _report_cache.get(key)
+        if cached is not None:
+            _report_cache.move_to_end(key)
+    if cached is not None:
+        return _copy_result(cached)
+
+    result = _analyse_report(content, filename)
+    with _report_cache_lock:
+        _report_cache[key] = _copy_result(result)
+        if len(_report_cache) > _REPORT_CACHE_SIZE:
+            _report_cache.popitem(last=False)
+    return result
+
+def _analyse_report(content: ReportSource, filename: str) -> ReportResult:
+    # Lower-cased once here; every field pattern is written for lower-case text
+    text = extract_text(content, filename).lower()
     extracted_data: dict[str, str] = {}
 
     if not text.strip():
@@ -382,51 +583,20 @@ def analyse_report(
         return label, confidence, t_score, bmd, "No readable text found in file -- statistical estimate", {}, None
 
     # ── Extract all 14 clinical features ─────────────────────────────────
-    age_r     = _age(text)
-    gender_r  = _gender(text)
-    weight_r  = _weight(text)
-    height_r  = _height(text)
-    bmi_r     = _bmi(text,
-                     weight_r[0] if weight_r else None,
-                     height_r[0] if height_r else None)
-    calcium_r = _calcium(text)
-    vitd_r    = _vitamin_d(text)
-    act_r     = _activity(text)
-    smok_r    = _smoking(text)
-    alc_r     = _alcohol(text)
-    fhist_r   = _family_history(text)
-    pfrac_r   = _prev_fracture(text)
-    meno_r    = _menopause(text)
-    ster_r    = _steroids(text)
-
-    field_map = {
-        "Age":               age_r,
-        "Gender":            gender_r,
-        "Weight":            weight_r,
-        "Height":            height_r,
-        "BMI":               bmi_r,
-        "Calcium Intake":    calcium_r,
-        "Vitamin D":         vitd_r,
-        "Physical Activity": act_r,
-        "Smoking":           smok_r,
-        "Alcohol":           alc_r,
-        "Family History":    fhist_r,
-        "Previous Fracture": pfrac_r,
-        "Menopause":         meno_r,
-        "Steroid Use":       ster_r,
-    }
-    for key, result in field_map.items():
+    results = [fn(text) for _, fn in _FIELD_EXTRACTORS]
+    if results[_BMI_IDX] is None:
+        results[_BMI_IDX] = _bmi_from(
+            results[_WEIGHT_IDX][0] if results[_WEIGHT_IDX] else None,
+            results[_HEIGHT_IDX][0] if results[_HEIGHT_IDX] else None,
+        )
+    for (key, _), result in zip(_FIELD_EXTRACTORS, results):
         if result is not None:
             extracted_data[key] = result[1]
 
     coverage = len(extracted_data)
 
     # ── Always build the 16-feature vector (may have defaults for missing) ─
-    raw_features_16 = build_tabular_features_16(
-        age_r, gender_r, weight_r, height_r, bmi_r,
-        calcium_r, vitd_r, act_r, smok_r, alc_r,
-        fhist_r, pfrac_r, meno_r, ster_r,
-    )
+    raw_features_16 = build_tabular_features_16(*results)
 
     # ── Also extract direct T-score / BMD ────────────────────────────────
     found_t:   Optional[float] = None
@@ -466,8 +636,8 @@ def analyse_report(
     # Keyword scan
     keyword_label: Optional[str] = None
     keyword_risk: float = 0.0
-    for pattern, kw_label, risk_delta in _DIAG_KEYWORDS:
-        if pattern.search(text):
+    for literal, pattern, kw_label, risk_delta in _DIAG_KEYWORDS:
+        if literal in text and pattern.search(text):
             keyword_risk += risk_delta
             if kw_label and keyword_label is None:
                 keyword_label = kw_label
@@ -476,23 +646,12 @@ def analyse_report(
 
     # ── PATH A: Enough clinical features -> manual scoring model ──────────
     if coverage >= _MIN_FEATURES_FOR_MANUAL:
-        age    = age_r[0]    if age_r    else 55.0
-        gender = gender_r[0] if gender_r else 0.0
-        weight = weight_r[0] if weight_r else 65.0
-        height = height_r[0] if height_r else 163.0
-        bmi_v  = bmi_r[0]    if bmi_r    else round(weight / ((height / 100) ** 2), 1)
-        calc   = calcium_r[0] if calcium_r else 1.0
-        vitd   = vitd_r[0]   if vitd_r   else 1.0
-        act    = act_r[0]    if act_r    else 1.0
-        smok   = smok_r[0]   if smok_r   else 0.0
-        alc    = alc_r[0]    if alc_r    else 0.0
-        fhist  = fhist_r[0]  if fhist_r  else 0.0
-        pfrac  = pfrac_r[0]  if pfrac_r  else 0.0
-        meno   = meno_r[0]   if meno_r   else (1.0 if gender == 0 and age >= 50 else 0.0)
-        ster   = ster_r[0]   if ster_r   else 0.0
-
-        features = [age, gender, weight, height, bmi_v, calc, vitd, act,
-                    smok, alc, fhist, pfrac, meno, ster]
+        features = [r[0] if r is not None else d for r, d in zip(results, _FIELD_DEFAULTS)]
+        # Defaults that depend on other fields
+        if results[_BMI_IDX] is None:
+            features[_BMI_IDX] = round(features[_WEIGHT_IDX] / ((features[_HEIGHT_IDX] / 100) ** 2), 1)
+        if results[_MENO_IDX] is None:
+            features[_MENO_IDX] = 1.0 if features[_GENDER_IDX] == 0 and features[_AGE_IDX] >= 50 else 0.0
 
         from models.manual_rule_model import score_features
         pred_label, confidence, t_score, bmd = score_features(features)
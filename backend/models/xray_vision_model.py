@@ -24,7 +24,10 @@ from __future__ import annotations
 import io
 import math
 import hashlib
-from typing import Tuple, Dict
+from typing import TYPE_CHECKING, Tuple, Dict
+
+if TYPE_CHECKING:
+    from PIL import Image
 
 # ─── Tuning constants ────────────────────────────────────────────────────────
 _BG_LOW  = 20    # pixels <= this are background (black)
@@ -36,121 +39,137 @@ _OSTEOPENIA_DS: float = 0.390  # density_score threshold Osteopenia / Osteoporos
 
 # ─── Helpers ─────────────────────────────────────────────────────────────────
 
-def _pct(sorted_vals, p):
-    if not sorted_vals:
-        return 128.0
-    k = (len(sorted_vals) - 1) * p / 100.0
-    lo, hi = int(k), min(int(k) + 1, len(sorted_vals) - 1)
-    return sorted_vals[lo] + (k - lo) * (sorted_vals[hi] - sorted_vals[lo])
-
+def _shannon_entropy(hist: "np.ndarray", bins: int = 32) -> float:
+    """Shannon entropy of a 256-level histogram regrouped into `bins` bins."""
+    import numpy as np
 
-def _shannon_entropy(pixels: list[int], bins: int = 32) -> float:
-    if not pixels:
+    n = hist.sum()
+    if not n:
         return 0.0
-    step = 256 / bins
-    counts = [0] * bins
-    for p in pixels:
-        counts[min(bins - 1, int(p / step))] += 1
-    n = len(pixels)
-    entropy = 0.0
-    for c in counts:
-        if c > 0:
-            p_val = c / n
-            entropy -= p_val * math.log2(p_val)
-    return entropy
-
-
-def _block_variance(pixels: list[int], width: int, height: int, block: int = 8) -> float:
+    counts = hist.reshape(bins, -1).sum(axis=1)  # bins must divide 256
+    p_val = counts[counts > 0] / n
+    return float(-(p_val * np.log2(p_val)).sum())
+
+
+def _hist_percentiles(hist: "np.ndarray", n: int, qs) -> list[float]:
+    """
+    Percentiles of the n pixels counted in a 256-level histogram, using the
+    same linear interpolation as np.percentile — but read off the cumulative
+    counts in O(256) instead of sorting the pixels.
+    """
+    import numpy as np
+
+    cdf = np.cumsum(hist)
+    k = (n - 1) * np.asarray(qs, dtype=np.float64) / 100.0
+    lo = k.astype(np.intp)
+    hi = np.minimum(lo + 1, n - 1)
+    # The i-th smallest pixel is the first level whose cumulative count exceeds i
+    v_lo = np.searchsorted(cdf, lo, side="right")
+    v_hi = np.searchsorted(cdf, hi, side="right")
+    return (v_lo + (k - lo) * (v_hi - v_lo)).tolist()
+
+
+def _block_variance(pixels: "np.ndarray", block: int = 8) -> float:
     """Mean local variance across non-overlapping block-size patches."""
-    variances = []
-    for by in range(0, height - block, block):
-        for bx in range(0, width - block, block):
-            patch = [pixels[by * width + bx + dx + dy * width]
-                     for dy in range(block) for dx in range(block)]
-            if len(patch) == 0:
-                continue
-            m = sum(patch) / len(patch)
-            v = sum((p - m) ** 2 for p in patch) / len(patch)
-            variances.append(v)
-    return (sum(variances) / len(variances)) if variances else 500.0
-
-
-def _gradient_density(pixels: list[int], width: int, height: int) -> float:
+    height, width = pixels.shape
+    # Blocks start at 0, block, … < dim - block, so the trailing row/column
+    # of blocks is never included (even when the image divides evenly).
+    ny, nx = (height - 1) // block, (width - 1) // block
+    if ny <= 0 or nx <= 0:
+        return 500.0
+    tiles = pixels[:ny * block, :nx * block].reshape(ny, block, nx, block)
+    return float(tiles.var(axis=(1, 3)).mean())      # uint8 → float64 reduction
+
+
+def _gradient_density(pixels: "np.ndarray") -> float:
     """Mean absolute pixel gradient (horizontal + vertical)."""
-    total_grad = 0.0
-    count = 0
-    for y in range(height):
-        for x in range(width - 1):
-            total_grad += abs(pixels[y * width + x] - pixels[y * width + x + 1])
-            count += 1
-    for y in range(height - 1):
-        for x in range(width):
-            total_grad += abs(pixels[y * width + x] - pixels[(y + 1) * width + x])
-            count += 1
-    return (total_grad / count) if count else 30.0
+    import numpy as np
+
+    height, width = pixels.shape
+    count = height * (width - 1) + (height - 1) * width
+    if count <= 0:
+        return 30.0
+    r = pixels.astype(np.int16)                  # uint8 differences would wrap
+    total_grad = np.abs(np.diff(r, axis=1)).sum() + np.abs(np.diff(r, axis=0)).sum()
+    return float(total_grad) / count
 
 
 # ─── Core feature extraction ─────────────────────────────────────────────────
 
-def _extract_features(image_bytes: bytes) -> Tuple[dict, int, int, list[int]]:
+def decode_xray(image_bytes: bytes) -> Image.Image:
     """
-    Open image, compute all diagnostic features.
-    Returns (features_dict, width, height, all_pixels).
-    Raises on failure so caller can fall back to hash.
+    Fully decode an upload once so the CNN preprocessing and the heuristic
+    features can share it.  The result is only ever read, never mutated,
+    so the two may use it from different threads.
     """
     from PIL import Image
 
-    img = Image.open(io.BytesIO(image_bytes)).convert("L")
+    img = Image.open(io.BytesIO(image_bytes))
+    img.load()
+    return img
 
-    # Down-sample for speed: cap longest dim at 400px
-    w, h = img.size
+
+def _extract_features(image: bytes | Image.Image) -> Tuple[dict, int, int, "np.ndarray"]:
+    """
+    Open image (raw bytes, or a decode_xray() image), compute all
+    diagnostic features.
+    Returns (features_dict, width, height, pixels) — pixels is the (h, w)
+    uint8 array; all per-pixel statistics are computed on it in NumPy.
+    Raises on failure so caller can fall back to hash.
+    """
+    import numpy as np
+    from PIL import Image
+
+    # Down-sample for speed: cap longest dim at 400px.  draft() lets the JPEG
+    # decoder scale by 1/2–1/8 while decoding (no-op for other formats);
+    # bilinear is ample for the histogram / block statistics below.
     max_dim = 400
-    if max(w, h) > max_dim:
-        scale = max_dim / max(w, h)
-        w, h = max(1, int(w * scale)), max(1, int(h * scale))
-        img = img.resize((w, h), Image.LANCZOS)
-
-    raw = list(img.getdata())
-    n_raw = len(raw)
-    if n_raw == 0:
+    if isinstance(image, (bytes, bytearray)):
+        image = Image.open(io.BytesIO(image))
+        image.draft("L", (max_dim, max_dim))
+    img = image.convert("L")                     # always a new image
+    img.thumbnail((max_dim, max_dim), Image.BILINEAR)
+    w, h = img.size
+
+    raw = np.asarray(img, dtype=np.uint8)          # (h, w)
+    if raw.size == 0:
         raise ValueError("Empty image")
 
-    # Filter background and saturation
-    bone = [p for p in raw if _BG_LOW < p < _BG_HIGH]
-    n_bone = len(bone)
+    # Filter background and saturation.  The bone-pixel statistics below
+    # read this one 256-level histogram instead of re-scanning the pixels.
+    hist = np.bincount(raw.ravel(), minlength=256)
+    hist[:_BG_LOW + 1] = 0
+    hist[_BG_HIGH:] = 0
+    n_bone = int(hist.sum())
     if n_bone < 100:          # almost no bone pixels -> treat as fallback
         raise ValueError("Too few bone pixels")
 
-    bone_sorted = sorted(bone)
-
     # ── Intensity percentiles ────────────────────────────────────────────
-    mean_i = sum(bone) / n_bone
-    var_i  = sum((p - mean_i) ** 2 for p in bone) / n_bone
-    std_i  = math.sqrt(var_i)
-    p10  = _pct(bone_sorted, 10)
-    p25  = _pct(bone_sorted, 25)
-    p50  = _pct(bone_sorted, 50)
-    p75  = _pct(bone_sorted, 75)
-    p90  = _pct(bone_sorted, 90)
+    levels = np.arange(256)
+    mean_i = float(hist @ levels) / n_bone
+    std_i  = math.sqrt(float(hist @ (levels - mean_i) ** 2) / n_bone)   # population std
+    p10, p25, p50, p75, p90 = _hist_percentiles(hist, n_bone, (10, 25, 50, 75, 90))
 
     # ── Pixel ratio bands ────────────────────────────────────────────────
-    bright = sum(1 for p in bone if p > 180) / n_bone    # dense cortical
-    mid    = sum(1 for p in bone if 80 <= p <= 180) / n_bone
-    dark   = sum(1 for p in bone if p < 80) / n_bone     # sparse/porous
+    n_bright = int(hist[181:].sum())
+    n_dark   = int(hist[:80].sum())
+    bright = n_bright / n_bone                       # dense cortical
+    mid    = (n_bone - n_bright - n_dark) / n_bone   # 80 <= p <= 180
+    dark   = n_dark / n_bone                         # sparse/porous
 
     # ── Cortical score: fraction of very bright pixels ───────────────────
-    cortical = sum(1 for p in bone if p > 200) / n_bone
+    cortical = int(hist[201:].sum()) / n_bone
 
     # ── Trabecular complexity (block variance, normalized to 0-1) ────────
-    block_var = _block_variance(raw, w, h, block=8)
+    block_var = _block_variance(raw, block=8)
     trab_score = min(1.0, block_var / 2000.0)   # 2000 = typical full-variance reference
 
     # ── Edge density (gradient) ──────────────────────────────────────────
-    edge_density = _gradient_density(raw, w, h)
+    edge_density = _gradient_density(raw)
     edge_norm = min(1.0, edge_density / 60.0)   # 60 = typical high-edge reference
 
     # ── Histogram entropy ────────────────────────────────────────────────
-    entropy = _shannon_entropy(bone, bins=32)
+    entropy = _shannon_entropy(hist, bins=32)
     entropy_norm = min(1.0, entropy / 5.0)      # 5 bits/symbol ~ near max
 
     feats = {
@@ -247,11 +266,6 @@ def _features_to_biomarkers(f: dict) -> Tuple[str, float, float, float]:
 
 def _build_metrics_display(f: dict, label: str, t_score: float, bmd: float) -> dict[str, str]:
     """Convert raw feature dict into human-readable display values for the UI."""
-    def pct_bar(v, lo=0.0, hi=1.0):
-        norm = (v - lo) / (hi - lo) if hi > lo else 0.5
-        filled = round(norm * 10)
-        return "▓" * filled + "░" * (10 - filled)
-
     cortical_pct = round(f["cortical"] * 100, 1)
     dark_pct     = round(f["dark_ratio"] * 100, 1)
     bright_pct   = round(f["bright_ratio"] * 100, 1)
@@ -277,15 +291,15 @@ def _build_metrics_display(f: dict, label: str, t_score: float, bmd: float) -> d
 # ─── Fallback ────────────────────────────────────────────────────────────────
 
 def _fallback_hash(image_bytes: bytes) -> Tuple[str, float, float, float, dict]:
-    digest   = hashlib.sha256(image_bytes).hexdigest()
-    hash_val = int(digest[:8], 16) / 0xFFFFFFFF
+    digest   = hashlib.sha256(image_bytes).digest()
+    hash_val = int.from_bytes(digest[:4], "big") / 0xFFFFFFFF
     if hash_val < 0.38:
         label, t, b, cb = "Normal",       round(-0.2 - hash_val, 2), round(0.94 + hash_val * 0.05, 3), 0.71
     elif hash_val < 0.72:
         label, t, b, cb = "Osteopenia",   round(-1.2 - hash_val * 1.5, 2), round(0.82 - hash_val * 0.10, 3), 0.70
     else:
         label, t, b, cb = "Osteoporosis", round(-2.6 - hash_val * 1.5, 2), round(0.62 - hash_val * 0.15, 3), 0.69
-    jitter = int(digest[8:12], 16) / 0xFFFF * 0.14
+    jitter = int.from_bytes(digest[4:6], "big") / 0xFFFF * 0.14
     conf = round(min(0.93, cb + jitter), 4)
     return label, conf, max(-5.5, t), max(0.35, round(b, 3)), {}
 
@@ -351,44 +365,73 @@ def _bmd_from_tscore(t_score: float) -> float:
     return max(0.35, min(1.30, bmd))
 
 
-def analyse_xray_cnn(
-    image_bytes: bytes,
-    model,
-) -> Tuple[str, float, float, float, Dict[str, str]]:
+# ImageNet mean / std pre-scaled to 0-255 so normalisation runs on raw pixels
+_CNN_INPUT_SIZE = (300, 300)
+_IMAGENET_MEAN_255 = (0.485 * 255, 0.456 * 255, 0.406 * 255)
+_IMAGENET_STD_255  = (0.229 * 255, 0.224 * 255, 0.225 * 255)
+
+
+def preprocess_xray_cnn(image: bytes | Image.Image):
     """
-    Run EfficientNet-B3 inference on a bone X-ray image.
+    Decode an image (raw bytes, or a decode_xray() image) into the
+    (1, 3, 300, 300) channels-last tensor expected by EfficientNet-B3.
 
-    Preprocessing matches training:
-      • Resize to 300×300
-      • Convert to RGB
-      • ToTensor + ImageNet normalisation
+    Preprocessing matches training (torchvision Resize → ToTensor → Normalize):
+      • Convert to RGB, bilinear resize to 300×300
+      • (pixel − 255·mean) / (255·std), written into one float32 array
 
-    Returns:
-        (label, confidence, t_score, bmd, analysis_metrics)
+    Grayscale ("L") scans — most X-rays — are resized as a single channel
+    and broadcast across RGB during normalisation, which is identical to
+    convert("RGB") first but skips the 3-channel decode copy and resize.
+
+    The HWC array is exposed to torch as an NCHW view, whose strides are
+    already channels-last — no per-request transform pipeline or extra copy.
     """
-    import io as _io
-    import torch
     import numpy as np
+    import torch
     from PIL import Image
-    from torchvision import transforms
-
-    _tfm = transforms.Compose([
-        transforms.Resize((300, 300)),
-        transforms.ToTensor(),
-        transforms.Normalize(
-            mean=[0.485, 0.456, 0.406],
-            std=[0.229, 0.224, 0.225],
-        ),
-    ])
-
-    # ── Decode & preprocess ───────────────────────────────────────────────
-    img = Image.open(_io.BytesIO(image_bytes)).convert("RGB")
-    x   = _tfm(img).unsqueeze(0)          # (1, 3, 300, 300)
-
-    # ── Inference ─────────────────────────────────────────────────────────
-    with torch.no_grad():
-        logits = model(x)
-        proba  = torch.softmax(logits, dim=1).numpy()[0]   # shape (3,)
+
+    # BytesIO over a bytes object shares its buffer, so this is not a copy.
+    img = Image.open(io.BytesIO(image)) if isinstance(image, (bytes, bytearray)) else image
+    if img.mode != "L":
+        img = img.convert("RGB")
+    img = img.resize(_CNN_INPUT_SIZE, Image.BILINEAR)
+
+    pixels = np.asarray(img)                     # (300, 300) or (300, 300, 3) uint8
+    if pixels.ndim == 2:
+        pixels = pixels[..., None]               # broadcast gray → RGB below
+    arr = np.empty((*_CNN_INPUT_SIZE, 3), dtype=np.float32)
+    np.subtract(pixels, _IMAGENET_MEAN_255, out=arr)
+    arr /= _IMAGENET_STD_255
+    return torch.from_numpy(arr).permute(2, 0, 1).unsqueeze(0)   # (1, 3, 300, 300)
+
+
+def heuristic_features(image: bytes | Image.Image) -> dict | None:
+    """
+    Heuristic feature dict for the CNN diagnostic panel, or None if the
+    image can't be analysed.  Independent of the CNN, so callers run it in
+    a worker thread alongside inference.
+    """
+    try:
+        feats, _, _, _ = _extract_features(image)
+        return feats
+    except Exception:
+        return None
+
+
+def cnn_result_from_proba(
+    proba,
+    image_bytes: bytes | None = None,
+    feats: dict | None = None,
+) -> Tuple[str, float, float, float, Dict[str, str]]:
+    """
+    Turn the 3-class softmax output for one image into
+    (label, confidence, t_score, bmd, analysis_metrics).
+
+    Pass `feats` from heuristic_features() when it was computed concurrently
+    with inference; otherwise it is extracted here from `image_bytes`.
+    """
+    import numpy as np
 
     pred_idx   = int(np.argmax(proba))
     label      = _CNN_CLASSES[pred_idx]
@@ -399,12 +442,10 @@ def analyse_xray_cnn(
     bmd     = _bmd_from_tscore(t_score)
 
     # ── Build display metrics ─────────────────────────────────────────────
-    # Try to also run heuristic feature extraction for the diagnostic panel
-    try:
-        feats, _, _, _ = _extract_features(image_bytes)
-        metrics = _build_metrics_display(feats, label, t_score, bmd)
-    except Exception:
-        metrics = {}
+    # Heuristic features also feed the diagnostic panel when available
+    if feats is None and image_bytes is not None:
+        feats = heuristic_features(image_bytes)
+    metrics = _build_metrics_display(feats, label, t_score, bmd) if feats else {}
 
     # Add CNN-specific entries
     metrics["Model"]            = "EfficientNet-B3 (Deep CNN)"
@@ -8,15 +8,24 @@ Usage:
 
 Or directly with uvicorn:
     uvicorn app.main:app --host 0.0.0.0 --port 8000
+
+Worker processes default to half the CPU cores (each worker runs one
+BLAS / torch thread, see app/main.py); override with WEB_CONCURRENCY.
+uvicorn[standard] provides uvloop + httptools, which "auto" selects
+wherever they're installed (uvloop has no Windows build).
 """
 import os
 import uvicorn
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8000))
+    workers = int(os.environ.get("WEB_CONCURRENCY", max(1, (os.cpu_count() or 2) // 2)))
     uvicorn.run(
         "app.main:app",
         host="0.0.0.0",
         port=port,
+        workers=workers,
+        loop="auto",
+        http="auto",
         reload=False,
     )
@@ -0,0 +1,10 @@
+"""
+conftest.py
+─────────────────────────────────────────────────────────────────────────────
+Put backend/ on sys.path so tests import `app` and `models` exactly as
+uvicorn does, whichever directory pytest is started from.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
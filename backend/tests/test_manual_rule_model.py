@@ -0,0 +1,53 @@
+"""
+test_manual_rule_model.py
+─────────────────────────────────────────────────────────────────────────────
+score_features_batch must agree with score_features row for row, including
+short (zero-padded) and long (truncated) feature rows.
+"""
+import numpy as np
+import pytest
+
+from models.manual_rule_model import score_features, score_features_batch
+
+
+def _random_rows(rng: np.random.Generator, n: int, k: int) -> np.ndarray:
+    cols = [
+        rng.uniform(18, 95, n),                                   # age
+        rng.integers(0, 2, n),                                    # gender
+        rng.uniform(35, 130, n),                                  # weight
+        np.where(rng.random(n) < 0.05, 0.0, rng.uniform(140, 200, n)),   # height (0 → fallback BMI)
+        np.where(rng.random(n) < 0.3, 0.0, rng.uniform(14, 42, n)),      # bmi (≤ 5 → derived)
+        rng.integers(0, 3, n),                                    # calcium_intake
+        rng.integers(0, 2, n),                                    # vitamin_d
+        rng.integers(0, 3, n),                                    # physical_activity
+        rng.integers(0, 2, n),                                    # smoking
+        rng.integers(0, 3, n),                                    # alcohol
+        rng.integers(0, 2, n),                                    # family_history
+        rng.integers(0, 2, n),                                    # prev_fracture
+        rng.integers(0, 2, n),                                    # menopause
+        rng.integers(0, 2, n),                                    # steroid_use
+        rng.uniform(0, 5, n),                                     # extra columns → truncated
+        rng.uniform(0, 5, n),
+    ]
+    return np.column_stack(cols[:k]).astype(np.float64)
+
+
+@pytest.mark.parametrize("k", [6, 13, 14, 16])
+def test_batch_matches_scalar(k):
+    X = _random_rows(np.random.default_rng(k), 2000, k)
+    labels, conf, t_score, bmd = score_features_batch(X)
+
+    expected = [score_features(row) for row in X.tolist()]
+    assert labels.tolist() == [e[0] for e in expected]
+    np.testing.assert_allclose(conf,    [e[1] for e in expected], rtol=0, atol=1e-12)
+    np.testing.assert_allclose(t_score, [e[2] for e in expected], rtol=0, atol=1e-9)
+    np.testing.assert_allclose(bmd,     [e[3] for e in expected], rtol=0, atol=1e-9)
+
+
+def test_single_row_is_a_batch_of_one():
+    row = [67, 0, 58.0, 160.0, 0, 0, 0, 0, 1, 2, 1, 1, 1, 0]
+    labels, conf, t_score, bmd = score_features_batch(row)
+    assert labels.shape == (1,)
+    assert (labels[0], conf[0]) == score_features(row)[:2]
+    assert t_score[0] == pytest.approx(score_features(row)[2], abs=1e-9)
+    assert bmd[0] == pytest.approx(score_features(row)[3], abs=1e-9)
@@ -0,0 +1,31 @@
+"""
+test_routes.py
+─────────────────────────────────────────────────────────────────────────────
+Every path is registered exactly once — at import, and after the app has
+been started repeatedly (the lifespan swaps in the cached /openapi.json).
+"""
+from collections import Counter
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+
+
+def _duplicate_paths() -> dict[str, int]:
+    counts = Counter(getattr(r, "path", None) for r in app.routes)
+    return {path: n for path, n in counts.items() if n > 1}
+
+
+def test_paths_registered_once():
+    assert _duplicate_paths() == {}
+
+
+def test_report_route_registered_once():
+    assert len([r for r in app.routes if r.path == "/predict/report"]) == 1
+
+
+def test_paths_registered_once_after_restarts():
+    for _ in range(3):
+        with TestClient(app) as client:
+            assert client.get(app.openapi_url).status_code == 200
+    assert _duplicate_paths() == {}